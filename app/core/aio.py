@@ -0,0 +1,59 @@
+"""
+Async clients bound to an event loop. They only pay off on the long-lived
+loop of an ASGI worker: under WSGI Django runs every async view in a new
+loop (async_to_sync), so code there uses the sync clients through
+sync_to_async instead. Clients registered with `on_loop_shutdown` are closed
+when their loop is shut down (asyncio.run) or when the worker exits.
+"""
+import asyncio
+import weakref
+from typing import Awaitable, Callable
+
+from django.conf import settings
+
+_loops = weakref.WeakKeyDictionary()
+
+
+def loop_clients_enabled() -> bool:
+    return settings.SERVER_MODE == 'asgi'
+
+
+def check_loop_clients():
+    if not loop_clients_enabled():
+        raise RuntimeError('Async clients are only used under ASGI, '
+                           'call the sync client through sync_to_async')
+
+
+async def _run_closers(loop_ref, closers):
+    try:
+        yield
+    finally:
+        # Clients keep a reference to their loop, drop them with it
+        if loop_ref() is not None:
+            _loops.pop(loop_ref(), None)
+        for close in closers:
+            try:
+                await close()
+            except Exception as e:
+                print('Async client close error:', e)
+
+
+def on_loop_shutdown(close: Callable[[], Awaitable]):
+    """Await `close()` when the running loop shuts down"""
+    loop = asyncio.get_running_loop()
+    entry = _loops.get(loop)
+    if entry is None:
+        closers = []
+        # The loop finalizes unfinished async generators on shutdown
+        agen = _run_closers(weakref.ref(loop), closers)
+        loop.create_task(agen.__anext__())
+        entry = _loops[loop] = (agen, closers)
+    entry[1].append(close)
+
+
+def close_all():
+    """Close clients of loops which are not running any more, for worker exit"""
+    for loop, (agen, _) in list(_loops.items()):
+        if not loop.is_closed() and not loop.is_running():
+            loop.run_until_complete(agen.aclose())
+    _loops.clear()
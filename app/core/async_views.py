@@ -0,0 +1,55 @@
+"""
+DRF views with async handlers. Authentication, permissions and throttling
+run as usual (in a worker thread, they may hit the database); `async def`
+handlers are awaited on the event loop, sync ones are run in a thread.
+Under WSGI Django runs the view through async_to_sync, so it works there
+too, just without the concurrency.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from rest_framework import generics, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+
+class AsyncAPIView(APIView):
+    view_is_async = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            if asyncio.iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncCreateAPIView(AsyncAPIView, generics.CreateAPIView):
+    """
+    Create view for serializers implementing `async def acreate(validated_data)`
+    """
+
+    async def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        serializer.instance = await serializer.acreate(serializer.validated_data)
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
@@ -0,0 +1,116 @@
+"""
+Count strategies for paginated querysets. `exact` runs COUNT(*) on every
+request, `cached` keeps the exact count in the cache for a short TTL, and
+`estimated` uses PostgreSQL statistics once the table is big enough.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+
+def estimate_count(queryset) -> int:
+    """
+    Row count estimated by the PostgreSQL planner for the queryset, without
+    executing it. Other databases get an exact count
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def table_estimate(queryset) -> int:
+    """
+    Whole table row count from pg_class.reltuples, -1 if never analyzed.
+    A partitioned table has no rows of its own (its reltuples stays 0 or -1),
+    so the estimates of its leaf partitions are summed; partitions which
+    were never analyzed, e.g. empty future months, count as 0
+    """
+    connection = connections[queryset.db]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT SUM(GREATEST(c.reltuples, 0)), MAX(c.reltuples) '
+            'FROM pg_partition_tree(%s::regclass) tree '
+            'JOIN pg_class c ON c.oid = tree.relid WHERE tree.isleaf',
+            [queryset.model._meta.db_table])
+        total, analyzed = cursor.fetchone()
+    if analyzed is None or analyzed < 0:
+        return -1
+    return int(total)
+
+
+class ExactCount:
+    is_exact = True
+
+    def count(self, queryset) -> int:
+        return queryset.count()
+
+
+class CachedCount:
+    """Exact count cached by the normalized SQL of the queryset"""
+    is_exact = True
+
+    def __init__(self, timeout: int = None):
+        self.timeout = timeout if timeout is not None else settings.PAGINATION_COUNT_CACHE_TIMEOUT
+
+    def cache_key(self, queryset) -> str:
+        sql, params = queryset.query.sql_with_params()
+        digest = hashlib.sha1(f'{queryset.db}:{sql}:{params!r}'.encode()).hexdigest()
+        return f'pagination:count:{digest}'
+
+    def count(self, queryset) -> int:
+        key = self.cache_key(queryset)
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, self.timeout)
+        return count
+
+
+class EstimatedCount:
+    """
+    Planner estimate above `threshold` rows, exact count below it. Unfiltered
+    querysets read reltuples, filtered ones EXPLAIN the query
+    """
+    is_exact = False
+
+    def __init__(self, threshold: int = None):
+        self.threshold = threshold if threshold is not None else settings.PAGINATION_ESTIMATE_THRESHOLD
+
+    def count(self, queryset) -> int:
+        if connections[queryset.db].vendor != 'postgresql':
+            return queryset.count()
+
+        if not queryset.query.where:
+            estimate = table_estimate(queryset)
+        else:
+            estimate = estimate_count(queryset)
+
+        if estimate < self.threshold:
+            return queryset.count()
+        return estimate
+
+
+STRATEGIES = {
+    'exact': ExactCount,
+    'cached': CachedCount,
+    'estimated': EstimatedCount,
+}
+
+
+def get_counter(strategy=None):
+    """Strategy instance by name, an instance is returned as is"""
+    strategy = strategy or settings.PAGINATION_COUNT_STRATEGY
+    if isinstance(strategy, str):
+        return STRATEGIES[strategy]()
+    return strategy
@@ -0,0 +1,86 @@
+"""
+Background dispatch of request side effects (Redis writes, task publishing).
+Side effects are queued only after the surrounding transaction commits and
+run in a daemon thread, so the request doesn't wait on Redis or the broker.
+The queue is drained when the process exits (atexit, gunicorn worker_exit).
+"""
+import atexit
+import os
+import queue
+import threading
+
+from django.conf import settings
+from django.db import transaction
+
+
+class BackgroundDispatcher:
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_thread(self):
+        # Threads don't survive fork, start a new one in every worker process
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                self._queue = queue.Queue(self.maxsize)
+                self._thread = threading.Thread(
+                    target=self._run, name='background-dispatcher', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                # Drain marker, everything queued before it is done
+                self._queue.task_done()
+                return
+            func, args, kwargs = item
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                print(f'\033[91m Dispatch error: {str(e)} \033[0m')
+            finally:
+                self._queue.task_done()
+
+    def submit(self, func, *args, **kwargs):
+        if not settings.BACKGROUND_DISPATCH:
+            return func(*args, **kwargs)
+
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait((func, args, kwargs))
+        except queue.Full:
+            # Backpressure: run inline rather than drop the side effect
+            func(*args, **kwargs)
+
+    def join(self):
+        """Wait until queued side effects are done"""
+        if self._queue is not None and self._pid == os.getpid():
+            self._queue.join()
+
+    def drain(self, timeout: float = None):
+        """Run what is still queued and stop the thread, before the process exits"""
+        with self._lock:
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                return
+            thread = self._thread
+            # Blocks while the queue is full, the thread keeps taking items
+            self._queue.put(None)
+        thread.join(settings.DISPATCH_DRAIN_TIMEOUT if timeout is None else timeout)
+        if thread.is_alive():
+            print(f'\033[91m Dispatcher not drained, {self._queue.qsize()} side effects lost \033[0m')
+
+
+dispatcher = BackgroundDispatcher()
+atexit.register(dispatcher.drain)
+
+
+def dispatch_on_commit(func, *args, **kwargs):
+    """Run func in the background after the current transaction commits"""
+    transaction.on_commit(lambda: dispatcher.submit(func, *args, **kwargs))
@@ -1,6 +1,11 @@
 from rest_framework.fields import ListField
 from rest_framework import serializers
 
+from core.uploads import StoredUploadedFile
+
+# Formats core.uploads.sniff_image lets through
+STREAMED_IMAGE_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+
 
 class ManyToManyFormDataField(ListField):
     """
@@ -68,3 +73,33 @@ class ReadWriteSerializerMethodField(serializers.SerializerMethodField):
 
     def to_internal_value(self, data):
         return {self.field_name: data}
+
+
+class StreamedImageField(serializers.ImageField):
+    """
+    Image field accepting uploads of core.uploads.StreamingStorageUploadHandler.
+    Their header was only sniffed, so the stored file is verified and decoded
+    by Pillow before it's accepted. Other uploads are verified as usual
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, StoredUploadedFile):
+            file_object = serializers.FileField.to_internal_value(self, data)
+            self.verify_stored(data)
+            return file_object
+        return super().to_internal_value(data)
+
+    def verify_stored(self, data: StoredUploadedFile):
+        from PIL import Image
+
+        try:
+            # verify() checks the structure, load() catches truncated data
+            with data.storage.open(data.storage_name, 'rb') as f:
+                Image.open(f).verify()
+                f.seek(0)
+                with Image.open(f) as image:
+                    if image.format not in STREAMED_IMAGE_FORMATS:
+                        self.fail('invalid_image')
+                    image.load()
+        except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+            self.fail('invalid_image')
@@ -0,0 +1,107 @@
+"""
+Shared keep-alive HTTP session for calls to external APIs. Connections to a
+host are pooled and reused between requests, every call gets a timeout.
+Async views under ASGI use the httpx client of their event loop instead.
+"""
+import asyncio
+import os
+import threading
+import weakref
+from typing import TYPE_CHECKING
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from core import aio
+
+if TYPE_CHECKING:
+    import httpx
+
+
+class TimeoutSession(requests.Session):
+    """Session applying settings.HTTP_TIMEOUT when a call passes none"""
+
+    def request(self, *args, **kwargs):
+        kwargs.setdefault('timeout', settings.HTTP_TIMEOUT)
+        return super().request(*args, **kwargs)
+
+
+class HttpSessions:
+    """Sessions created per process, sockets are not shared after fork"""
+
+    def __init__(self):
+        self._session = None
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _create(self) -> requests.Session:
+        session = TimeoutSession()
+        adapter = HTTPAdapter(
+            pool_connections=settings.HTTP_POOL_CONNECTIONS,
+            pool_maxsize=settings.HTTP_POOL_MAXSIZE,
+            max_retries=settings.HTTP_MAX_RETRIES,
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def get(self) -> requests.Session:
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._session = self._create()
+                    self._async_clients = weakref.WeakKeyDictionary()
+                    self._pid = os.getpid()
+        return self._session
+
+    def get_async(self) -> 'httpx.AsyncClient':
+        """
+        Client of the running event loop of an ASGI worker, its connections
+        can't leave the loop. Closed when the loop shuts down
+        """
+        # Imported here, WSGI workers never need it
+        import httpx
+
+        aio.check_loop_clients()
+        if self._pid != os.getpid():
+            self.get()
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            connect_timeout, read_timeout = settings.HTTP_TIMEOUT
+            client = self._async_clients[loop] = httpx.AsyncClient(
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(max_connections=settings.HTTP_ASYNC_MAX_CONNECTIONS,
+                                    max_keepalive_connections=settings.HTTP_POOL_MAXSIZE),
+                transport=httpx.AsyncHTTPTransport(retries=settings.HTTP_MAX_RETRIES),
+            )
+            aio.on_loop_shutdown(self._closer(loop, client))
+        return client
+
+    def _closer(self, loop, client):
+        loop_ref = weakref.ref(loop)
+
+        async def close():
+            if loop_ref() is not None:
+                self._async_clients.pop(loop_ref(), None)
+            await client.aclose()
+        return close
+
+    def reset(self):
+        with self._lock:
+            self._session = None
+            self._async_clients = weakref.WeakKeyDictionary()
+            self._pid = None
+
+
+http_sessions = HttpSessions()
+
+
+def http_session() -> requests.Session:
+    return http_sessions.get()
+
+
+def async_http_client() -> 'httpx.AsyncClient':
+    return http_sessions.get_async()
@@ -0,0 +1,123 @@
+"""
+JSON Web Key Sets of identity providers, cached in process memory and in the
+Django cache. Keys are refreshed in a background thread before they go stale
+and refetched at once when a token names an unknown `kid` (key rotation).
+"""
+import json
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+import jwt
+from django.conf import settings
+from django.core.cache import cache
+
+from core.http import http_session
+
+
+class JWKSError(Exception):
+    pass
+
+
+def fetch_jwks(url: str) -> dict:
+    response = http_session().get(url)
+    response.raise_for_status()
+    return response.json()
+
+
+class JWKSCache:
+    """
+    :param ttl: seconds a fetched key set is kept
+    :param refresh_after: age after which it is refreshed in the background
+    :param miss_interval: minimal seconds between refetches on unknown kid,
+        so random kids can't turn every request into an outbound call
+    """
+
+    def __init__(self, url: str, fetch: Callable[[str], dict] = fetch_jwks, ttl: int = None,
+                 refresh_after: int = None, miss_interval: int = None):
+        self.url = url
+        self.fetch = fetch
+        self.ttl = ttl or settings.JWKS_CACHE_TIMEOUT
+        self.refresh_after = refresh_after or settings.JWKS_REFRESH_AFTER
+        self.miss_interval = miss_interval if miss_interval is not None else settings.JWKS_MISS_INTERVAL
+        self._keys = {}
+        self._fetched_at = 0
+        self._last_miss_fetch = 0
+        self._refreshing = None
+        self._lock = threading.Lock()
+
+    @property
+    def cache_key(self) -> str:
+        return f'jwks:{self.url}'
+
+    def _load(self, jwks: dict, fetched_at: float):
+        keys = {}
+        for data in jwks.get('keys', []):
+            try:
+                key = jwt.PyJWK(data)
+            except jwt.PyJWTError:
+                # Unsupported key types are skipped, not fatal
+                continue
+            keys[data.get('kid')] = key
+        self._keys = keys
+        self._fetched_at = fetched_at
+
+    def _fetch(self):
+        """Download the key set and share it with other processes"""
+        jwks = self.fetch(self.url)
+        fetched_at = time.time()
+        cache.set(self.cache_key, json.dumps({'jwks': jwks, 'fetched_at': fetched_at}), self.ttl)
+        with self._lock:
+            self._load(jwks, fetched_at)
+
+    def _from_shared_cache(self) -> bool:
+        cached = cache.get(self.cache_key)
+        if cached is None:
+            return False
+        cached = json.loads(cached)
+        with self._lock:
+            self._load(cached['jwks'], cached['fetched_at'])
+        return True
+
+    def _refresh_in_background(self):
+        with self._lock:
+            thread = self._refreshing
+            if thread is not None and thread.is_alive() and thread.pid == os.getpid():
+                return
+            thread = self._refreshing = threading.Thread(
+                target=self._background_refresh, name='jwks-refresh', daemon=True)
+            thread.pid = os.getpid()
+        thread.start()
+
+    def _background_refresh(self):
+        try:
+            # Another process may have refreshed it already
+            if not self._from_shared_cache() or self._age() >= self.refresh_after:
+                self._fetch()
+        except Exception as e:
+            print('JWKS refresh error:', self.url, e)
+
+    def _age(self) -> float:
+        return time.time() - self._fetched_at
+
+    def get_key(self, kid: Optional[str]) -> jwt.PyJWK:
+        if not self._keys or self._age() >= self.ttl:
+            if not self._from_shared_cache() or self._age() >= self.ttl:
+                self._fetch()
+        elif self._age() >= self.refresh_after:
+            self._refresh_in_background()
+
+        key = self._keys.get(kid)
+        if key is not None:
+            return key
+
+        # Unknown kid: the provider may have rotated keys
+        now = time.monotonic()
+        if now - self._last_miss_fetch >= self.miss_interval:
+            self._last_miss_fetch = now
+            self._fetch()
+            key = self._keys.get(kid)
+        if key is None:
+            raise JWKSError(f'Unknown key id {kid}')
+        return key
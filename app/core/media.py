@@ -0,0 +1,100 @@
+"""
+Coordination for content addressed media (settings.MEDIA_CONTENT_HASH_PATHS).
+A stored file may be reused by several uploads and rows, so reusing it and
+deleting it happen under a per-name Redis lock, and an upload holds its file
+(in the shared cache) until the row pointing at it is saved.
+"""
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Iterable
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.redis import redis_pools, release_lock
+
+LOCK_TIMEOUT = 30
+
+
+@contextmanager
+def locked(name: str, timeout: float = LOCK_TIMEOUT):
+    client = redis_pools.client()
+    key = f'media:lock:{name}'
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + timeout
+    while not client.set(key, token, nx=True, ex=int(timeout)):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f'Media lock for {name} is busy')
+        time.sleep(0.05)
+    try:
+        yield
+    finally:
+        # Don't release a lock which expired and was taken by another process
+        release_lock(client, key, token)
+
+
+def _held_key(name: str) -> str:
+    return f'media:held:{name}'
+
+
+def _hold(name: str):
+    key = _held_key(name)
+    if not cache.add(key, 1, settings.MEDIA_HOLD_TIMEOUT):
+        cache.incr(key)
+
+
+def _release(name: str):
+    key = _held_key(name)
+    try:
+        if cache.decr(key) <= 0:
+            cache.delete(key)
+    except ValueError:
+        # Expired already
+        pass
+
+
+def _delete_unused(storage, name: str, in_use: Callable[[], bool] = None, names: Iterable[str] = None) -> bool:
+    if cache.get(_held_key(name)) or (in_use is not None and in_use()):
+        return False
+    for item in names or [name]:
+        storage.delete(item)
+    return True
+
+
+def save_once(storage, name: str, content) -> bool:
+    """
+    Store content under name unless a file is there already and hold it,
+    release() it once it's referenced. Returns True when the file was created
+    """
+    with locked(name):
+        _hold(name)
+        if storage.exists(name):
+            return False
+        try:
+            storage.save(name, content)
+        except Exception:
+            _release(name)
+            raise
+        return True
+
+
+def release(name: str):
+    with locked(name):
+        _release(name)
+
+
+def discard(storage, name: str, in_use: Callable[[], bool] = None) -> bool:
+    """Release a held file and delete it unless it's held again or in_use()"""
+    with locked(name):
+        _release(name)
+        return _delete_unused(storage, name, in_use)
+
+
+def delete_unused(storage, name: str, in_use: Callable[[], bool], names: Iterable[str] = None) -> bool:
+    """
+    Delete names (name itself by default) unless the file under name is held
+    by an upload or in_use() says it's referenced
+    """
+    with locked(name):
+        return _delete_unused(storage, name, in_use, names)
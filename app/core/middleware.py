@@ -0,0 +1,21 @@
+import time
+
+from django.conf import settings
+from django.utils.deprecation import MiddlewareMixin
+
+
+class TraceSamplingMiddleware(MiddlewareMixin):
+    """
+    Reports the duration and outcome of every request to the traces
+    sampler, so failing and slow routes get traced more (see sentry_sampling.py)
+    """
+
+    def process_request(self, request):
+        request._trace_started = time.monotonic()
+
+    def process_response(self, request, response):
+        started = getattr(request, '_trace_started', None)
+        if started is not None:
+            settings.SENTRY_TRACES_SAMPLER.record_request(
+                request.path_info, time.monotonic() - started, response.status_code >= 500)
+        return response
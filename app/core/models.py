@@ -10,3 +10,13 @@ def safe_file_path(instance, filename):
     path = '/'.join(parts)
     filename = f'{uuid.uuid4()}.{ext}'
     return f'{instance.__class__.__name__.lower()}/{path}/{filename}'
+
+
+def content_hash_path(filename, digest, prefix=None):
+    """
+    Path of a file addressed by its content hash, sharded by the first hex
+    digits: {prefix}/ab/cd/abcd...ef.png. Identical files get the same path
+    """
+    ext = filename.split('.')[-1].lower()
+    path = f'{digest[:2]}/{digest[2:4]}/{digest}.{ext}'
+    return f'{prefix}/{path}' if prefix else path
@@ -1,12 +1,68 @@
+import datetime
+import json
+from base64 import b64decode, b64encode
 from collections import OrderedDict
+from functools import partial
 from math import ceil
+from operator import attrgetter
 
-from rest_framework.pagination import PageNumberPagination
+from django.core.paginator import EmptyPage, Paginator as DjangoPaginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from core.counting import estimate_count, get_counter
+
+
+class CountingPaginator(DjangoPaginator):
+    """Django paginator taking its count from a core.counting strategy"""
+
+    def __init__(self, *args, counter=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.counter = counter or get_counter('exact')
+
+    @cached_property
+    def count(self):
+        return self.counter.count(self.object_list)
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            # Estimated totals may be low, don't reject pages past the estimate
+            if self.counter.is_exact or int(number) < 1:
+                raise
+            return int(number)
+
+    def page(self, number):
+        if self.counter.is_exact:
+            return super().page(number)
+        # No clipping to the estimated count, the slice decides where data ends
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(self.object_list[bottom:bottom + self.per_page], number, self)
 
 
 class DefaultPager(PageNumberPagination):
+    """
+    Page number pagination. The total count strategy is taken from the view's
+    `count_strategy` ('exact', 'cached', 'estimated' or a core.counting
+    instance), defaulting to settings.PAGINATION_COUNT_STRATEGY
+    """
     page_size_query_param = 'page_size'
+    counter = None
+
+    @property
+    def django_paginator_class(self):
+        return partial(CountingPaginator, counter=self.counter)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.counter = get_counter(getattr(view, 'count_strategy', None))
+        return super().paginate_queryset(queryset, request, view)
 
     def pages_count(self):
         return ceil(self.page.paginator.count/self.get_page_size(self.request))
@@ -47,3 +103,138 @@ class DefaultPager(PageNumberPagination):
                 'results': schema,
             },
         }
+
+
+def _cursor_value(value):
+    # DjangoJSONEncoder cuts times to milliseconds, the seek needs them exact
+    if isinstance(value, (datetime.datetime, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+class KeysetPager(BasePagination):
+    """
+    Cursor pagination which seeks on indexed `ordering` columns instead of
+    OFFSET and never counts rows. Set `include_estimated_count` for clients
+    that need a total, it comes from planner statistics.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 100
+    max_page_size = 1000
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    include_estimated_count = False
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def _fields(self):
+        return [(name.lstrip('-'), name.startswith('-')) for name in self.ordering]
+
+    def encode_cursor(self, instance, reverse: bool) -> str:
+        position = [_cursor_value(attrgetter(name)(instance)) for name, _ in self._fields()]
+        data = json.dumps({'p': position, 'r': int(reverse)}, cls=DjangoJSONEncoder)
+        return b64encode(data.encode()).decode()
+
+    def decode_cursor(self, queryset, encoded):
+        try:
+            data = json.loads(b64decode(encoded.encode()))
+            fields = [queryset.model._meta.get_field(name) for name, _ in self._fields()]
+            position = [field.to_python(value) for field, value in zip(fields, data['p'])]
+            return position, bool(data['r'])
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def _seek(self, position, reverse):
+        """
+        Rows after position in ordering: (a, b) > (x, y) is expanded to
+        a > x OR (a = x AND b > y), plus a bound on the first column for the index
+        """
+        condition, equal = Q(), Q()
+        for (name, descending), value in zip(self._fields(), position):
+            lookup = 'lt' if descending != reverse else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+
+        name, descending = self._fields()[0]
+        bound = Q(**{f'{name}__{"lte" if descending != reverse else "gte"}': position[0]})
+        return bound & condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        self.queryset = queryset
+
+        reverse = False
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded:
+            position, reverse = self.decode_cursor(queryset, encoded)
+            queryset = queryset.filter(self._seek(position, reverse))
+
+        ordering = self.ordering
+        if reverse:
+            ordering = [name[1:] if name.startswith('-') else f'-{name}' for name in ordering]
+
+        rows = list(queryset.order_by(*ordering)[:self.page_size_value + 1])
+        has_more = len(rows) > self.page_size_value
+        rows = rows[:self.page_size_value]
+        if reverse:
+            rows.reverse()
+
+        self.page = rows
+        # Going back: there is always a next page; a previous one only if more rows
+        self.has_next = has_more if not reverse else bool(rows)
+        self.has_previous = bool(encoded) if not reverse else has_more
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1], False))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        url = self.request.build_absolute_uri()
+        if not self.page:
+            return remove_query_param(url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[0], True))
+
+    def get_paginated_response(self, data):
+        count = estimate_count(self.queryset) if self.include_estimated_count else None
+        return Response(OrderedDict([
+            ('count', count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('page_size', self.page_size_value),
+            ('page_size_query_param', self.page_size_query_param),
+            ('cursor_query_param', self.cursor_query_param),
+            ('results', data)
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'count': {
+                    'type': 'integer',
+                    'nullable': True,
+                    'description': 'Planner estimate, only with include_estimated_count',
+                },
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                },
+                'previous': {
+                    'type': 'string',
+                    'nullable': True,
+                },
+                'results': schema,
+            },
+        }
@@ -1,16 +1,143 @@
+import asyncio
+import os
+import threading
+import weakref
+
 from django.conf import settings
 
 import redis
+import redis.asyncio as aioredis
 
+from core import aio
+
+
+# Delete a lock only while it still holds the caller's token
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def release_lock(client: redis.Redis, key: str, token: str) -> bool:
+    return bool(client.eval(RELEASE_LOCK_SCRIPT, 1, key, token))
+
+
+def pool_stats(pool: redis.BlockingConnectionPool) -> dict:
+    """
+    Connection usage of a blocking pool. Its queue holds idle connections
+    and None placeholders for connections not created yet
+    """
+    created = sum(1 for connection in pool._connections if connection is not None)
+    available = sum(1 for connection in list(pool.pool.queue) if connection is not None)
+    return {
+        'max_connections': pool.max_connections,
+        'created': created,
+        'in_use': created - available,
+        'available': available,
+    }
+
+
+class RedisPools:
+    """
+    Named Redis connection pools shared by the whole process. Pools are
+    created on first use from settings.REDIS_POOLS and rebuilt after fork,
+    so gunicorn and celery prefork children never share sockets. Pools block
+    up to REDIS_POOL_TIMEOUT for a free connection instead of failing when
+    all threads of a worker hold one.
+    """
 
-class RedisStorage:
     def __init__(self):
-        self.connection = redis.Redis(
-            host=settings.REDIS_SERVER,
-            db=settings.REDIS_APP_DB,
-            password=settings.REDIS_PASSWORD,
-            decode_responses=True,
-        )
+        self._pools = {}
+        self._async_pools = weakref.WeakKeyDictionary()
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def _pool_kwargs(self, name: str) -> dict:
+        options = settings.REDIS_POOLS[name]
+        return {
+            'host': settings.REDIS_SERVER,
+            'port': int(settings.REDIS_PORT or 6379),
+            'password': settings.REDIS_PASSWORD,
+            'max_connections': settings.REDIS_MAX_CONNECTIONS,
+            'timeout': settings.REDIS_POOL_TIMEOUT,
+            'socket_timeout': settings.REDIS_SOCKET_TIMEOUT,
+            'socket_connect_timeout': settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+            'health_check_interval': settings.REDIS_HEALTH_CHECK_INTERVAL,
+            **options,
+        }
+
+    def pool(self, name: str = 'default') -> redis.BlockingConnectionPool:
+        if self._pid != os.getpid():
+            self.reset()
+
+        pool = self._pools.get(name)
+        if pool is None:
+            with self._lock:
+                pool = self._pools.get(name)
+                if pool is None:
+                    pool = self._pools[name] = redis.BlockingConnectionPool(**self._pool_kwargs(name))
+        return pool
+
+    def client(self, name: str = 'default') -> redis.Redis:
+        return redis.Redis(connection_pool=self.pool(name))
+
+    def async_client(self, name: str = 'default') -> aioredis.Redis:
+        """
+        Client for the running event loop of an ASGI worker. asyncio
+        connections belong to the loop they were opened in, so every loop
+        gets its own pools, disconnected when the loop shuts down
+        """
+        aio.check_loop_clients()
+        if self._pid != os.getpid():
+            self.reset()
+
+        pools = self._async_pools.setdefault(asyncio.get_running_loop(), {})
+        pool = pools.get(name)
+        if pool is None:
+            pool = pools[name] = aioredis.BlockingConnectionPool(**self._pool_kwargs(name))
+            aio.on_loop_shutdown(self._closer(asyncio.get_running_loop(), name, pool))
+        return aioredis.Redis(connection_pool=pool)
+
+    def _closer(self, loop, name, pool):
+        loop_ref = weakref.ref(loop)
+
+        async def close():
+            if loop_ref() is not None:
+                self._async_pools.get(loop_ref(), {}).pop(name, None)
+            await pool.disconnect()
+        return close
+
+    def reset(self):
+        """
+        Forget pools inherited from the parent process. Sockets are dropped
+        without closing, the parent still owns them
+        """
+        with self._lock:
+            for pool in self._pools.values():
+                pool.reset()
+            self._pools = {}
+            self._async_pools = weakref.WeakKeyDictionary()
+            self._pid = os.getpid()
+
+    def disconnect(self):
+        with self._lock:
+            for pool in self._pools.values():
+                pool.disconnect()
+
+    def stats(self) -> dict:
+        """Connection usage per pool of this process"""
+        return {name: pool_stats(pool) for name, pool in self._pools.items()}
+
+
+redis_pools = RedisPools()
+
+
+class RedisStorage:
+    @property
+    def connection(self) -> redis.Redis:
+        return redis_pools.client('default')
 
 
 redis_storage = RedisStorage()
@@ -1,7 +1,13 @@
+import time
+
 from celery import shared_task
-from celery.signals import worker_init, worker_shutdown
+from celery.signals import (
+    task_postrun, task_prerun, worker_init, worker_process_init, worker_shutdown)
+from django.conf import settings
+
+from core.redis import redis_pools, redis_storage
 
-from core.redis import redis_storage
+_task_started = {}
 
 
 @worker_init.connect
@@ -12,9 +18,29 @@ def on_worker_init(*_, **__):
         redis_storage.connection.delete(*keys)
 
 
+@worker_process_init.connect
+def on_worker_process_init(*_, **__):
+    # Prefork child: drop Redis connections inherited from the parent
+    redis_pools.reset()
+
+
 @worker_shutdown.connect
 def on_worker_shutdown(*_, **__):
-    redis_storage.connection.close()
+    redis_pools.disconnect()
+
+
+@task_prerun.connect
+def on_task_prerun(task_id=None, **__):
+    _task_started[task_id] = time.monotonic()
+
+
+@task_postrun.connect
+def on_task_postrun(task_id=None, task=None, state=None, **__):
+    # Failing and slow tasks get traced more, see sentry_sampling.py
+    started = _task_started.pop(task_id, None)
+    if started is not None and task is not None:
+        settings.SENTRY_TRACES_SAMPLER.record_task(
+            task.name, time.monotonic() - started, state in ('FAILURE', 'RETRY'))
 
 
 @shared_task(name="celery_test_task")
@@ -0,0 +1,26 @@
+import asyncio
+
+from django.test import SimpleTestCase, override_settings
+
+from core import aio
+
+
+class LoopShutdownTests(SimpleTestCase):
+
+    def test_clients_are_closed_with_their_loop(self):
+        closed = []
+
+        async def close():
+            closed.append(True)
+
+        async def main():
+            aio.on_loop_shutdown(close)
+
+        asyncio.run(main())
+        self.assertEqual(closed, [True])
+        self.assertEqual(len(aio._loops), 0)
+
+    @override_settings(SERVER_MODE='wsgi')
+    def test_no_loop_clients_under_wsgi(self):
+        with self.assertRaises(RuntimeError):
+            aio.check_loop_clients()
@@ -0,0 +1,28 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from core.cache import LocalLRUCache
+
+
+class LocalLRUCacheTests(SimpleTestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LocalLRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_entry_expires(self):
+        cache = LocalLRUCache(ttl=5)
+        with mock.patch('core.cache.time.monotonic', return_value=100):
+            cache.set('a', 1)
+        with mock.patch('core.cache.time.monotonic', return_value=104):
+            self.assertEqual(cache.get('a'), 1)
+        with mock.patch('core.cache.time.monotonic', return_value=106):
+            self.assertIsNone(cache.get('a'))
@@ -0,0 +1,63 @@
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+
+from core.counting import CachedCount, EstimatedCount, ExactCount, table_estimate
+from core.pagination import CountingPaginator
+from mail.models import Mail
+
+
+class CountStrategyTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        for i in range(5):
+            User.objects.create_user(email=f'user{i}@example.com', password='password')
+
+    def setUp(self):
+        cache.clear()
+        self.queryset = get_user_model().objects.order_by('id')
+
+    def test_exact_count(self):
+        self.assertEqual(ExactCount().count(self.queryset), 5)
+
+    def test_cached_count_is_reused(self):
+        counter = CachedCount(timeout=60)
+        self.assertEqual(counter.count(self.queryset), 5)
+        get_user_model().objects.create_user(email='late@example.com', password='password')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(counter.count(self.queryset), 5)
+        # Another filter is another key
+        self.assertEqual(counter.count(self.queryset.filter(email__startswith='late')), 1)
+
+    def test_estimate_below_threshold_is_exact(self):
+        counter = EstimatedCount(threshold=1000)
+        self.assertEqual(counter.count(self.queryset), 5)
+        self.assertEqual(counter.count(self.queryset.filter(email='user1@example.com')), 1)
+
+    def test_paginator_serves_pages_past_an_estimate(self):
+        class LowEstimate:
+            is_exact = False
+
+            def count(self, queryset):
+                return 2
+
+        paginator = CountingPaginator(self.queryset, 2, counter=LowEstimate())
+        self.assertEqual(paginator.count, 2)
+        self.assertEqual(len(paginator.page(3)), 1)
+
+        exact = CountingPaginator(self.queryset, 2, counter=ExactCount())
+        self.assertEqual(exact.num_pages, 3)
+        self.assertEqual(len(exact.page(3)), 1)
+
+    @skipUnless(connection.vendor == 'postgresql', 'reltuples is PostgreSQL only')
+    def test_partitioned_table_estimate(self):
+        Mail.objects.bulk_create([Mail(email=f'user{i}@example.com', subject='Hi') for i in range(3)])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE mail_mail')
+        self.assertEqual(table_estimate(Mail.objects.all()), 3)
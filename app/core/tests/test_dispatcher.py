@@ -0,0 +1,22 @@
+import threading
+
+from django.test import SimpleTestCase, override_settings
+
+from core.dispatcher import BackgroundDispatcher
+
+
+@override_settings(BACKGROUND_DISPATCH=True)
+class BackgroundDispatcherTests(SimpleTestCase):
+
+    def test_drain_runs_queued_side_effects(self):
+        dispatcher = BackgroundDispatcher()
+        release = threading.Event()
+        done = []
+        dispatcher.submit(release.wait)
+        for i in range(3):
+            dispatcher.submit(done.append, i)
+
+        release.set()
+        dispatcher.drain(timeout=5)
+        self.assertEqual(done, [0, 1, 2])
+        self.assertFalse(dispatcher._thread.is_alive())
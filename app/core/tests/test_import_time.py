@@ -0,0 +1,56 @@
+import os
+import re
+import subprocess
+import sys
+from unittest import skipUnless
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+# Imported on first use only, never by django.setup()
+LAZY_MODULES = ('firebase_admin', 'twilio', 'PIL', 'httpx')
+
+
+def measure_setup():
+    """
+    Modules imported by django.setup() in a fresh interpreter, as
+    (set of module names, [(top level module, cumulative microseconds)])
+    """
+    # Offline development settings, the check is about imports only
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='settings', SECRETS_OFFLINE='1', IS_DEVELOPMENT='1')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import django; django.setup()'],
+        cwd=APP_DIR, env=env, capture_output=True, text=True, check=True)
+    modules = set()
+    imports = []
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if not match:
+            continue
+        modules.add(match.group(4))
+        # Nested imports are indented and already counted in their parent
+        if len(match.group(3)) == 1:
+            imports.append((match.group(4), int(match.group(2))))
+    return modules, imports
+
+
+class ImportTimeTests(SimpleTestCase):
+
+    def test_heavy_modules_are_not_imported(self):
+        modules, _ = measure_setup()
+        imported = sorted({name.split('.')[0] for name in modules} & set(LAZY_MODULES))
+        self.assertEqual(imported, [], f'django.setup() imports {", ".join(imported)}')
+
+    # Wall clock time depends on the machine, opt in with IMPORT_TIME_CHECK=1
+    @skipUnless(os.environ.get('IMPORT_TIME_CHECK'), 'IMPORT_TIME_CHECK is not set')
+    def test_django_setup_within_budget(self):
+        _, imports = measure_setup()
+        total_ms = sum(us for _, us in imports) / 1000
+        slowest = sorted(imports, key=lambda item: item[1], reverse=True)[:10]
+        report = '\n'.join(f'{us / 1000:8.1f} ms  {module}' for module, us in slowest)
+        self.assertLessEqual(
+            total_ms, settings.IMPORT_TIME_BUDGET_MS,
+            f'django.setup() imports took {total_ms:.0f} ms, '
+            f'budget is {settings.IMPORT_TIME_BUDGET_MS} ms. Slowest:\n{report}')
@@ -0,0 +1,51 @@
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import SimpleTestCase
+
+from core import media
+from core.redis import redis_pools
+
+
+class MediaTests(SimpleTestCase):
+    name = 'tests/media/shared.txt'
+
+    def setUp(self):
+        self.addCleanup(default_storage.delete, self.name)
+
+    def test_save_once_reuses_the_stored_file(self):
+        self.assertTrue(media.save_once(default_storage, self.name, ContentFile(b'one')))
+        self.assertFalse(media.save_once(default_storage, self.name, ContentFile(b'one')))
+        media.release(self.name)
+        media.release(self.name)
+
+    def test_held_file_is_not_deleted(self):
+        media.save_once(default_storage, self.name, ContentFile(b'one'))
+        self.assertFalse(media.delete_unused(default_storage, self.name, lambda: False))
+        self.assertTrue(default_storage.exists(self.name))
+
+        media.release(self.name)
+        self.assertTrue(media.delete_unused(default_storage, self.name, lambda: False))
+        self.assertFalse(default_storage.exists(self.name))
+
+    def test_discard_keeps_a_file_reused_by_another_upload(self):
+        media.save_once(default_storage, self.name, ContentFile(b'one'))
+        media.save_once(default_storage, self.name, ContentFile(b'one'))
+
+        self.assertFalse(media.discard(default_storage, self.name))
+        self.assertTrue(default_storage.exists(self.name))
+        self.assertTrue(media.discard(default_storage, self.name))
+        self.assertFalse(default_storage.exists(self.name))
+
+    def test_referenced_file_is_not_deleted(self):
+        default_storage.save(self.name, ContentFile(b'one'))
+        self.assertFalse(media.delete_unused(default_storage, self.name, lambda: True))
+        self.assertTrue(default_storage.exists(self.name))
+
+    def test_lock_taken_over_after_expiry_is_kept(self):
+        client = redis_pools.client()
+        key = f'media:lock:{self.name}'
+        with media.locked(self.name):
+            # Expired and taken by another process meanwhile
+            client.set(key, 'other')
+        self.assertEqual(client.get(key), 'other')
+        client.delete(key)
@@ -0,0 +1,58 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core.pagination import KeysetPager
+
+CREATED_AT = datetime.datetime(2023, 5, 1, 12, 0, 0, 123000, tzinfo=datetime.timezone.utc)
+
+
+class Pager(KeysetPager):
+    page_size = 2
+
+
+class KeysetPagerTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.users = []
+        # Same millisecond, different microseconds
+        for i in range(5):
+            user = User.objects.create_user(email=f'user{i}@example.com', password='password')
+            User.objects.filter(pk=user.pk).update(
+                created_at=CREATED_AT + datetime.timedelta(microseconds=100 * i))
+            cls.users.append(user.pk)
+        cls.queryset = User.objects.filter(pk__in=cls.users)
+
+    def _page(self, url='/users/'):
+        pager = Pager()
+        request = Request(APIRequestFactory().get(url))
+        rows = pager.paginate_queryset(self.queryset, request)
+        return [row.pk for row in rows], pager
+
+    def test_cursor_keeps_microseconds(self):
+        user = self.queryset.get(pk=self.users[1])
+        pager = Pager()
+        position, reverse = pager.decode_cursor(self.queryset, pager.encode_cursor(user, True))
+        self.assertEqual(position, [user.created_at, user.pk])
+        self.assertTrue(reverse)
+        self.assertEqual(position[0].microsecond, 123100)
+
+    def test_walks_forward_and_back_without_gaps(self):
+        pages = []
+        rows, pager = self._page()
+        pages.append(rows)
+        while pager.get_next_link():
+            rows, pager = self._page(pager.get_next_link())
+            pages.append(rows)
+        self.assertEqual(sum(pages, []), list(reversed(self.users)))
+
+        back = []
+        while pager.get_previous_link():
+            rows, pager = self._page(pager.get_previous_link())
+            back.insert(0, rows)
+        self.assertEqual(back, pages[:-1])
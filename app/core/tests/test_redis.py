@@ -0,0 +1,32 @@
+from unittest import mock
+
+import redis
+from django.test import SimpleTestCase, override_settings
+
+from core.redis import RedisPools
+
+
+class RedisPoolsTests(SimpleTestCase):
+
+    @override_settings(REDIS_POOL_TIMEOUT=3, REDIS_MAX_CONNECTIONS=4)
+    def test_pool_waits_for_a_free_connection(self):
+        pool = RedisPools().pool()
+        self.assertIsInstance(pool, redis.BlockingConnectionPool)
+        self.assertEqual(pool.timeout, 3)
+        self.assertEqual(pool.max_connections, 4)
+
+    @override_settings(REDIS_MAX_CONNECTIONS=4)
+    def test_stats(self):
+        pools = RedisPools()
+        pool = pools.pool()
+        self.assertEqual(pools.stats()['default'],
+                         {'max_connections': 4, 'created': 0, 'in_use': 0, 'available': 0})
+
+        # Connections are created without connecting to a server
+        with mock.patch.object(redis.Connection, 'connect'):
+            first = pool.get_connection('GET')
+            second = pool.get_connection('GET')
+        pool.release(second)
+        self.assertEqual(pools.stats()['default'],
+                         {'max_connections': 4, 'created': 2, 'in_use': 1, 'available': 1})
+        pool.release(first)
@@ -0,0 +1,54 @@
+from django.test import SimpleTestCase
+
+from sentry_sampling import TracesSampler
+
+
+class Clock:
+    now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def request(path, **context):
+    return dict(context, wsgi_environ={'PATH_INFO': path})
+
+
+class TracesSamplerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.sampler = TracesSampler(
+            default_rate=0.05, task_rate=0.1,
+            route_rates={'/api/core/': 0, '/api/user/': 0.2, '/api/user/auth/': 0.5},
+            task_rates={'send_mail_batch': 0.01},
+            slow_request=1, slow_task=30, boost_rate=1, boost_seconds=60, clock=self.clock)
+
+    def test_rates_per_route_and_task(self):
+        self.assertEqual(self.sampler(request('/api/user/auth/email/')), 0.5)
+        self.assertEqual(self.sampler(request('/api/user/detail/')), 0.2)
+        self.assertEqual(self.sampler(request('/accounts/login/')), 0.05)
+        self.assertEqual(self.sampler({'celery_job': {'task': 'send_mail_batch'}}), 0.01)
+        self.assertEqual(self.sampler({'celery_job': {'task': 'process_avatar'}}), 0.1)
+
+    def test_parent_decision_is_kept(self):
+        self.assertEqual(self.sampler(request('/api/core/workers/', parent_sampled=True)), 1)
+        self.assertEqual(self.sampler(request('/api/user/detail/', parent_sampled=False)), 0)
+
+    def test_slow_and_failing_routes_are_boosted_for_a_while(self):
+        self.sampler.record_request('/api/user/12/', 0.2)
+        self.assertEqual(self.sampler(request('/api/user/13/')), 0.2)
+
+        self.sampler.record_request('/api/user/12/', 1.5)
+        self.assertEqual(self.sampler(request('/api/user/13/')), 1)
+        self.assertEqual(self.sampler(request('/api/user/detail/')), 0.2)
+
+        self.clock.now = 61
+        self.assertEqual(self.sampler(request('/api/user/13/')), 0.2)
+
+        self.sampler.record_task('send_mail_batch', 1, error=True)
+        self.assertEqual(self.sampler({'celery_job': {'task': 'send_mail_batch'}}), 1)
+
+    def test_disabled_routes_stay_disabled(self):
+        self.sampler.record_request('/api/core/workers/', 5, error=True)
+        self.assertEqual(self.sampler(request('/api/core/workers/')), 0)
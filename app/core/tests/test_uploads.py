@@ -0,0 +1,106 @@
+from io import BytesIO
+
+from django.core.files.storage import InMemoryStorage
+from django.test import SimpleTestCase
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+
+from core.fields import StreamedImageField
+from core.uploads import (
+    ContentHashUploadHandler, StoredUploadedFile, StreamingStorageUploadHandler, UploadTooLarge,
+    sniff_image)
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 100
+
+
+class StreamingStorageUploadHandlerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.storage = InMemoryStorage()
+        self.handler = StreamingStorageUploadHandler(
+            upload_to=lambda name: f'avatars/{name}', max_size=150, storage=self.storage)
+
+    def _upload(self, *chunks):
+        self.handler.new_file('avatar', 'a.png', 'image/png', None)
+        start = 0
+        for chunk in chunks:
+            self.handler.receive_data_chunk(chunk, start)
+            start += len(chunk)
+        return self.handler.file_complete(start)
+
+    def test_sniff_image(self):
+        self.assertEqual(sniff_image(PNG), 'png')
+        self.assertEqual(sniff_image(b'\xff\xd8\xff\xe0'), 'jpeg')
+        self.assertEqual(sniff_image(b'RIFF\x00\x00\x00\x00WEBPVP8 '), 'webp')
+        self.assertIsNone(sniff_image(b'<html>'))
+        self.assertIsNone(sniff_image(b'\x00\x00\x00\x1cftypavif'))
+
+    def test_image_is_streamed_to_storage(self):
+        upload = self._upload(PNG[:50], PNG[50:])
+
+        self.assertEqual(upload.storage_name, 'avatars/a.png')
+        self.assertEqual(upload.size, len(PNG))
+        with self.storage.open('avatars/a.png', 'rb') as f:
+            self.assertEqual(f.read(), PNG)
+
+    def test_rejects_non_image_before_storing(self):
+        with self.assertRaises(ValidationError):
+            self._upload(b'<html>' + b'\x00' * 10)
+        self.assertFalse(self.storage.exists('avatars/a.png'))
+
+    def test_aborts_once_limit_is_passed(self):
+        with self.assertRaises(UploadTooLarge):
+            self._upload(PNG, PNG)
+        self.assertFalse(self.storage.exists('avatars/a.png'))
+
+    def test_rejects_oversized_body_upfront(self):
+        with self.assertRaises(UploadTooLarge):
+            self.handler.handle_raw_input(None, {}, 10 * 1024 * 1024, b'boundary')
+
+
+class ContentHashUploadHandlerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.storage = InMemoryStorage()
+
+    def _upload(self, content):
+        handler = ContentHashUploadHandler(max_size=1000, storage=self.storage)
+        handler.new_file('avatar', 'a.PNG', 'image/png', None)
+        handler.receive_data_chunk(content, 0)
+        return handler.file_complete(len(content))
+
+    def test_identical_uploads_are_stored_once(self):
+        first = self._upload(PNG)
+        second = self._upload(PNG)
+
+        self.assertTrue(first.created)
+        self.assertFalse(second.created)
+        self.assertEqual(first.storage_name, second.storage_name)
+        self.assertRegex(first.storage_name, r'^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+
+        second.delete()
+        self.assertTrue(self.storage.exists(first.storage_name))
+
+
+class StreamedImageFieldTests(SimpleTestCase):
+
+    def setUp(self):
+        self.storage = InMemoryStorage()
+        self.field = StreamedImageField()
+
+    def _stored(self, content):
+        name = self.storage.save('a.png', BytesIO(content))
+        return StoredUploadedFile(self.storage, name, 'a.png', 'image/png', len(content), None)
+
+    def test_accepts_decodable_image(self):
+        buffer = BytesIO()
+        Image.new('RGB', (64, 64), (200, 10, 10)).save(buffer, format='PNG')
+        upload = self._stored(buffer.getvalue())
+        self.assertIs(self.field.to_internal_value(upload), upload)
+
+    def test_rejects_fake_and_truncated_images(self):
+        buffer = BytesIO()
+        Image.effect_noise((64, 64), 50).save(buffer, format='PNG')
+        for content in (PNG, buffer.getvalue()[:-200]):
+            with self.assertRaises(ValidationError):
+                self.field.to_internal_value(self._stored(content))
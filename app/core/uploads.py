@@ -0,0 +1,249 @@
+"""
+Upload handler writing file chunks straight to the storage backend while the
+request body is read. Oversized bodies are rejected before any chunk is read,
+oversized files as soon as the limit is passed, and files whose first chunk is
+not a known image header before anything is stored.
+ContentHashUploadHandler names files by their content instead, so identical
+uploads share one stored object, see core.media.
+"""
+import hashlib
+import os
+import tempfile
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from core import media
+from core.helpers import convert_size
+from core.models import content_hash_path
+
+# Room for multipart boundaries, headers and plain form fields
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = _('File is bigger than max file size (%(file_size)s)')
+    default_code = 'file_too_large'
+
+    def __init__(self, max_size: int):
+        super().__init__(self.default_detail % {'file_size': convert_size(max_size)})
+
+
+def sniff_image(head: bytes) -> Optional[str]:
+    """Image format by the file signature, None for anything else"""
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    # No HEIF/AVIF, Pillow can't decode them without plugins
+    return None
+
+
+class StoredUploadedFile(UploadedFile):
+    """
+    Upload which is already in storage under `storage_name`. Assign
+    `storage_name` to the model field to avoid saving it a second time.
+    `created` is False when an identical stored file was reused. `held`
+    content addressed files are kept from deletion until release()
+    """
+
+    def __init__(self, storage, storage_name, name, content_type, size, charset,
+                 content_type_extra=None, created=True, held=False):
+        super().__init__(None, name, content_type, size, charset, content_type_extra)
+        self.storage = storage
+        self.storage_name = storage_name
+        self.created = created
+        self.held = held
+
+    @cached_property
+    def file(self):
+        return self.storage.open(self.storage_name, 'rb')
+
+    def release(self):
+        if self.held:
+            self.held = False
+            media.release(self.storage_name)
+
+    def delete(self, in_use: Callable[[], bool] = None):
+        """Remove the stored file, content addressed ones only when nothing else uses them"""
+        if self.held:
+            self.held = False
+            media.discard(self.storage, self.storage_name, in_use)
+        elif self.created:
+            self.storage.delete(self.storage_name)
+
+
+class StreamingStorageUploadHandler(FileUploadHandler):
+    """
+    :param upload_to: callable returning the storage name for a client file name
+    :param max_size: limit per file in bytes, settings.MAX_UPLOAD_SIZE by default
+    :param sniff: callable telling if the first chunk is acceptable
+    """
+    chunk_size = 64 * 1024
+
+    def __init__(self, request=None, upload_to: Callable[[str], str] = None, max_size: int = None,
+                 sniff: Callable[[bytes], Optional[str]] = sniff_image, storage=None):
+        super().__init__(request)
+        self.upload_to = upload_to or (lambda file_name: file_name)
+        self.max_size = max_size or settings.MAX_UPLOAD_SIZE
+        self.sniff = sniff
+        self.storage = storage or default_storage
+        self.stored = []
+        self._reset()
+
+    def _reset(self):
+        self.storage_name = None
+        self.destination = None
+        self.received = 0
+
+    def _discard_partial(self):
+        if self.destination is not None:
+            self.destination.close()
+            self.storage.delete(self.storage_name)
+
+    def _abort(self, error):
+        self._discard_partial()
+        for name in self.stored:
+            self.storage.delete(name)
+        self._reset()
+        raise error
+
+    def _open_destination(self):
+        self._make_dirs()
+        return self.storage.open(self.storage_name, 'wb')
+
+    def _make_dirs(self):
+        # FileSystemStorage doesn't create directories on open(), remote
+        # storages have no local path
+        try:
+            path = self.storage.path(self.storage_name)
+        except NotImplementedError:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # Content-Length is known upfront, don't read a body that can't fit
+        if content_length and content_length > self.max_size + MULTIPART_OVERHEAD:
+            raise UploadTooLarge(self.max_size)
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self._reset()
+        self.storage_name = self.storage.get_available_name(self.upload_to(self.file_name))
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_size:
+            self._abort(UploadTooLarge(self.max_size))
+
+        if self.destination is None:
+            if self.sniff is not None and not self.sniff(raw_data[:32]):
+                self._abort(ValidationError(_('Upload a valid image')))
+            self.destination = self._open_destination()
+
+        self.destination.write(raw_data)
+        # Nothing is passed to the following handlers
+        return None
+
+    def file_complete(self, file_size):
+        if self.destination is None:
+            # Empty file, leave it to the field validation
+            return None
+        self.destination.close()
+        self.stored.append(self.storage_name)
+        return StoredUploadedFile(
+            self.storage, self.storage_name, self.file_name, self.content_type,
+            file_size, self.charset, self.content_type_extra)
+
+    def upload_interrupted(self):
+        self._discard_partial()
+        self._reset()
+
+
+class ContentHashUploadHandler(StreamingStorageUploadHandler):
+    """
+    Streaming handler storing files under the sha256 of their content.
+    Chunks are hashed while they are spooled to a temporary file; when the
+    hashed name already exists in storage the upload is skipped.
+
+    :param upload_to: callable(file_name, digest) returning the storage name,
+        core.models.content_hash_path by default
+    """
+
+    def __init__(self, request=None, upload_to: Callable[[str, str], str] = None, **kwargs):
+        super().__init__(request, upload_to=upload_to or content_hash_path, **kwargs)
+
+    def new_file(self, *args, **kwargs):
+        FileUploadHandler.new_file(self, *args, **kwargs)
+        self._reset()
+        self.hasher = hashlib.sha256()
+
+    def _discard_partial(self):
+        # Nothing is in storage before the file is complete
+        if self.destination is not None:
+            self.destination.close()
+
+    def _abort(self, error):
+        # Completed files may be reused by other uploads already, leave them
+        # to the view and only let go of them
+        self._discard_partial()
+        for name in self.stored:
+            media.release(name)
+        self._reset()
+        raise error
+
+    def _open_destination(self):
+        return tempfile.SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE, dir=settings.FILE_UPLOAD_TEMP_DIR)
+
+    def receive_data_chunk(self, raw_data, start):
+        super().receive_data_chunk(raw_data, start)
+        self.hasher.update(raw_data)
+
+    def file_complete(self, file_size):
+        if self.destination is None:
+            return None
+
+        name = self.upload_to(self.file_name, self.hasher.hexdigest())
+        self.destination.seek(0)
+        created = media.save_once(self.storage, name, File(self.destination))
+        self.stored.append(name)
+        self.destination.close()
+        return StoredUploadedFile(
+            self.storage, name, self.file_name, self.content_type,
+            file_size, self.charset, self.content_type_extra, created=created, held=True)
+
+
+class StreamingUploadMixin:
+    """
+    View mixin installing the streaming upload handler before the body is
+    parsed. Views define `get_upload_path(file_name, digest=None)`, digest is
+    given when settings.MEDIA_CONTENT_HASH_PATHS is on
+    """
+    upload_max_size = None
+
+    def get_upload_path(self, file_name: str, digest: str = None) -> str:
+        raise NotImplementedError
+
+    def get_upload_handler_class(self):
+        if settings.MEDIA_CONTENT_HASH_PATHS:
+            return ContentHashUploadHandler
+        return StreamingStorageUploadHandler
+
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = [self.get_upload_handler_class()(
+            request, upload_to=self.get_upload_path, max_size=self.upload_max_size)]
+        return super().initialize_request(request, *args, **kwargs)
@@ -0,0 +1,10 @@
+from django.urls import path
+
+from core import views
+
+app_name = 'core'
+
+urlpatterns = [
+    path('redis/pools/', views.RedisPoolStatsView.as_view(), name='redis_pools'),
+    path('workers/', views.WorkerStatsView.as_view(), name='workers'),
+]
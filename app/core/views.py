@@ -0,0 +1,35 @@
+from rest_framework.permissions import IsAdminUser
+from rest_framework.views import APIView
+
+from core import response
+from core.redis import pool_stats, redis_pools
+from core.worker_stats import all_workers
+
+
+class RedisPoolStatsView(APIView):
+    """
+        Redis pool usage of the current process.
+
+        Connections created, in use and available per named pool and for the cache.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        from django_redis import get_redis_connection
+
+        stats = redis_pools.stats()
+        cache_pool = get_redis_connection('default').connection_pool
+        stats['cache'] = pool_stats(cache_pool)
+        return response.ok(stats)
+
+
+class WorkerStatsView(APIView):
+    """
+        Request and memory stats of the web workers.
+
+        Snapshots published by every gunicorn worker, keyed by host and pid.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return response.ok(all_workers())
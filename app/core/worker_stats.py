@@ -0,0 +1,105 @@
+"""
+Request and memory counters of the current web worker process. Gunicorn
+hooks (gunicorn.conf.py) record every request; a snapshot is published to
+a Redis hash at most every WORKER_STATS_INTERVAL seconds, so the stats of
+all workers and containers can be read in one place.
+"""
+import json
+import os
+import resource
+import socket
+import time
+
+from django.conf import settings
+
+from core.redis import redis_pools
+
+STATS_KEY = 'gunicorn:workers'
+
+
+def rss_bytes() -> int:
+    """Current resident memory of the process"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # Peak instead of current where /proc is missing, KB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class WorkerStats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self, max_requests: int = 0):
+        self.pid = os.getpid()
+        self.name = f'{socket.gethostname()}:{self.pid}'
+        self.started_at = time.time()
+        self.max_requests = max_requests
+        self.requests = 0
+        self.errors = 0
+        self.total_duration = 0.0
+        self.max_duration = 0.0
+        self.max_rss = 0
+        self._published_at = 0.0
+
+    def record(self, duration: float, status_code: int):
+        self.requests += 1
+        if status_code >= 500:
+            self.errors += 1
+        self.total_duration += duration
+        self.max_duration = max(self.max_duration, duration)
+
+        now = time.monotonic()
+        if now - self._published_at >= settings.WORKER_STATS_INTERVAL:
+            self._published_at = now
+            self.publish()
+
+    def snapshot(self) -> dict:
+        rss = rss_bytes()
+        self.max_rss = max(self.max_rss, rss)
+        return {
+            'pid': self.pid,
+            'started_at': self.started_at,
+            'updated_at': time.time(),
+            'requests': self.requests,
+            'errors': self.errors,
+            'avg_duration_ms': round(self.total_duration / self.requests * 1000, 2) if self.requests else 0,
+            'max_duration_ms': round(self.max_duration * 1000, 2),
+            'rss': rss,
+            'max_rss': self.max_rss,
+            # Gunicorn recycles the worker when it reaches max_requests
+            'max_requests': self.max_requests,
+        }
+
+    def publish(self):
+        try:
+            redis_pools.client().hset(STATS_KEY, self.name, json.dumps(self.snapshot()))
+        except Exception as e:
+            print('Worker stats error:', e)
+
+    def unpublish(self):
+        try:
+            redis_pools.client().hdel(STATS_KEY, self.name)
+        except Exception as e:
+            print('Worker stats error:', e)
+
+
+def all_workers() -> dict:
+    """Published snapshots of live workers, stale ones are dropped"""
+    client = redis_pools.client()
+    workers = {}
+    stale = []
+    max_age = settings.WORKER_STATS_INTERVAL * 10
+    for name, data in client.hgetall(STATS_KEY).items():
+        data = json.loads(data)
+        if time.time() - data['updated_at'] > max_age:
+            stale.append(name)
+        else:
+            workers[name] = data
+    if stale:
+        client.hdel(STATS_KEY, *stale)
+    return workers
+
+
+worker_stats = WorkerStats()
@@ -0,0 +1,126 @@
+"""
+Gunicorn configuration, loaded from the working directory (/app).
+
+Workers and threads are sized from the CPU quota and memory limit of the
+container, the app is imported once in the master (preload_app) and forked.
+Hooks reset everything holding sockets after fork and recycle workers after
+a jittered number of requests. Every value can be overridden by env.
+"""
+import math
+import os
+import sys
+import time
+
+MB = 1024 * 1024
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cpu_limit() -> int:
+    """CPUs available to the container: cgroup quota, affinity, then host"""
+    cpu_max = _read('/sys/fs/cgroup/cpu.max')  # cgroup v2: "<quota> <period>"
+    if cpu_max and not cpu_max.startswith('max'):
+        quota, period = cpu_max.split()
+        return max(1, math.ceil(int(quota) / int(period)))
+    quota = _read('/sys/fs/cgroup/cpu/cpu.cfs_quota_us')  # cgroup v1
+    period = _read('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+    if quota and period and int(quota) > 0:
+        return max(1, math.ceil(int(quota) / int(period)))
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def memory_limit() -> int:
+    """Memory available to the container in bytes"""
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        value = _read(path)
+        # Unlimited is "max" in v2 and a huge number in v1
+        if value and value.isdigit() and int(value) < 1 << 50:
+            return int(value)
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi')
+CPUS = cpu_limit()
+# Expected peak memory of one worker, the rest is left to the master and page cache
+WORKER_MEMORY = int(os.environ.get('GUNICORN_WORKER_MEMORY_MB', 256)) * MB
+MEMORY_WORKERS = max(1, int(memory_limit() * 0.8) // WORKER_MEMORY)
+
+if SERVER_MODE == 'asgi':
+    wsgi_app = 'asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    # The event loop keeps a core busy on its own
+    cpu_workers = CPUS
+else:
+    wsgi_app = 'wsgi:application'
+    worker_class = 'gthread'
+    cpu_workers = CPUS * 2 + 1
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:80')
+workers = int(os.environ.get('WEB_CONCURRENCY', min(cpu_workers, MEMORY_WORKERS)))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+preload_app = True
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Recycle workers to release leaked memory; jitter keeps them from restarting together
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', max_requests // 10))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+
+
+def when_ready(server):
+    server.log.info(
+        f'{SERVER_MODE}: {workers} workers x {threads} threads '
+        f'({CPUS} cpus, {memory_limit() // MB} MB, max_requests {max_requests}+-{max_requests_jitter})')
+
+
+def pre_fork(server, worker):
+    # Children must not inherit open database sockets of the master
+    from django.db import connections
+    connections.close_all()
+
+
+def post_fork(server, worker):
+    from core.http import http_sessions
+    from core.redis import redis_pools
+    from core.worker_stats import worker_stats
+
+    redis_pools.reset()
+    http_sessions.reset()
+    if 'notifications.fire_push' in sys.modules:
+        sys.modules['notifications.fire_push'].reset_app()
+    worker_stats.reset(max_requests=worker.max_requests)
+    worker_stats.publish()
+
+
+def pre_request(worker, req):
+    req.started_at = time.monotonic()
+
+
+def post_request(worker, req, environ, resp):
+    from core.worker_stats import worker_stats
+
+    worker_stats.record(time.monotonic() - req.started_at, resp.status_code or 0)
+
+
+def worker_exit(server, worker):
+    from core import aio
+    from core.dispatcher import dispatcher
+    from core.worker_stats import worker_stats
+
+    # Recycled workers (max_requests) still send queued emails
+    dispatcher.drain()
+    worker_stats.unpublish()
+    aio.close_all()
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.utils.html import format_html
 
 from mail import models
 
@@ -6,5 +7,25 @@ from mail import models
 @admin.register(models.Mail)
 class MailAdmin(admin.ModelAdmin):
     search_fields = ['user__email']
-    list_display = ['user', 'email', 'is_send', 'created_at']
-    list_filter = ['is_send']
\ No newline at end of file
+    list_display = ['user', 'email', 'status', 'attempted_at', 'created_at']
+    list_filter = ['status']
+    # Date drill-down keeps queries within a few monthly partitions
+    date_hierarchy = 'created_at'
+    ordering = ['-created_at']
+    readonly_fields = ['attempted_at', 'created_at', 'rendered_body']
+    exclude = ['body']
+    list_select_related = ['user']
+
+    @admin.display(description='Body')
+    def rendered_body(self, obj):
+        return format_html(
+            '<iframe srcdoc="{}" style="width:100%;height:600px;border:0"></iframe>',
+            obj.render_body(),
+        )
+
+
+@admin.register(models.MailTemplate)
+class MailTemplateAdmin(admin.ModelAdmin):
+    search_fields = ['name', 'digest']
+    list_display = ['name', 'digest', 'created_at']
+    readonly_fields = ['digest', 'source', 'created_at']
\ No newline at end of file
@@ -0,0 +1,8 @@
+from django.db.models import TextChoices
+from django.utils.translation import gettext_lazy as _
+
+
+class MailStatus(TextChoices):
+    QUEUED = 'queued', _('Queued')
+    SENT = 'sent', _('Sent')
+    FAILED = 'failed', _('Failed')
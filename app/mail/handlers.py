@@ -1,19 +1,33 @@
 import os
 import settings
-from typing import Optional
+from datetime import timedelta
+from typing import List, Optional
 
-from django.core.mail import EmailMultiAlternatives
+from celery import current_app as celery_app
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
 from anymail.message import attach_inline_image_file, attach_inline_image
 
 
-from mail.models import Mail
+from core.redis import redis_storage
+from mail.enums import MailStatus
+from mail.models import Mail, MailTemplate
+from mail.registry import registry
 from user.models import User
 
 
+BATCH_PENDING_KEY = 'mail_batch:pending'
+
+# Template digest -> stored MailTemplate, filled once per process
+_template_versions = {}
+
+
 # ------------  Single sender ------------- #
-def single_sender_wrapper(subject: str, body: str, email: str, name: Optional[str] = '') -> bool:
+def build_message(subject: str, body: str, email: str, name: Optional[str] = '',
+                  connection=None) -> EmailMultiAlternatives:
     """
-        Sender wrapper
+        Build message with inline logo and html alternative
     """
     recepient = ''
     if name:
@@ -28,19 +42,26 @@ def single_sender_wrapper(subject: str, body: str, email: str, name: Optional[st
         [recepient],
         headers={
             'List-Unsubscribe': f'{settings.FRONTEND_URL}/unsubscribe/{email}',
-        }
+        },
+        connection=connection,
     )
 
     # Add the logo as a header for CID usage
-    with open('mail/templates/files/logo.png', 'rb') as logo_file:
-        logo_data = logo_file.read()
-        logo_cid = attach_inline_image(
-            msg, logo_data, 'logo.png', 'logo_cid')
-        body = body.replace('{{ logo }}', logo_cid)
-        msg.body = body
+    logo_cid = attach_inline_image(
+        msg, registry.logo(), 'logo.png', 'logo_cid')
+    body = body.replace('{{ logo }}', logo_cid)
+    msg.body = body
 
     # Alternative
     msg.attach_alternative(body, 'text/html')
+    return msg
+
+
+def single_sender_wrapper(subject: str, body: str, email: str, name: Optional[str] = '') -> bool:
+    """
+        Sender wrapper
+    """
+    msg = build_message(subject, body, email, name)
 
     # Await result from sender provider
     try:
@@ -52,30 +73,137 @@ def single_sender_wrapper(subject: str, body: str, email: str, name: Optional[st
         return False
 
 
+# ------------  Batch sender ------------- #
+def batch_sender(mails: List[Mail]) -> List[int]:
+    """
+        Send mails through one backend connection, return ids of sent mails
+    """
+    sent_ids, failed_ids = [], []
+    connection = get_connection()
+    connection.open()
+    try:
+        for mail in mails:
+            try:
+                msg = build_message(mail.subject, mail.render_body(), mail.email,
+                                    recipient_name(mail.user), connection=connection)
+                if connection.send_messages([msg]):
+                    sent_ids.append(mail.id)
+                    continue
+            except Exception as e:
+                print('Error: ', e)
+            failed_ids.append(mail.id)
+    finally:
+        connection.close()
+
+    set_status(sent_ids, MailStatus.SENT)
+    set_status(failed_ids, MailStatus.FAILED)
+    return sent_ids
+
+
+def send_pending_mails(batch_size: int = settings.MAIL_BATCH_SIZE) -> int:
+    """
+        Drain unsent mails in batches of `batch_size`, return count of sent mails
+    """
+    created_after = timezone.now() - timedelta(seconds=settings.MAIL_BATCH_MAX_AGE)
+    # Served by the (status, created_at) index, every batch leaves the queue
+    pending = Mail.objects.select_related('user', 'template').filter(
+        status=MailStatus.QUEUED, created_at__gte=created_after,
+    ).order_by('created_at', 'id')
+
+    sent = 0
+    while True:
+        with transaction.atomic():
+            # Claimed rows stay locked until their status is set, so
+            # overlapping flushers skip them instead of sending them twice
+            mails = list(pending.select_for_update(skip_locked=True, of=('self',))[:batch_size])
+            if not mails:
+                return sent
+            sent += len(batch_sender(mails))
+
+
+def enqueue_for_batch():
+    """
+        Count mail as pending and schedule batch flush: after a short window
+        for the first mail, right away once the batch is full
+    """
+    pipe = redis_storage.connection.pipeline()
+    pipe.incr(BATCH_PENDING_KEY)
+    pipe.expire(BATCH_PENDING_KEY, settings.MAIL_BATCH_WINDOW * 10)
+    pending, _ = pipe.execute()
+
+    if pending == 1:
+        celery_app.send_task('send_mail_batch', countdown=settings.MAIL_BATCH_WINDOW)
+    elif pending % settings.MAIL_BATCH_SIZE == 0:
+        celery_app.send_task('send_mail_batch')
+
+
 # --------------  Helpers ---------------- #
-def body_replace(body, variables):
+def set_status(mail_ids: List[int], status: MailStatus) -> int:
     """
-       Replace variables in templates
+       Move mails to status with one UPDATE touching only status columns
     """
-    new_body = body
-    for key, value in variables.items():
-        new_body = new_body.replace(str(key), str(value))
-        print('new_body: ', new_body)
-    return new_body
+    if not mail_ids:
+        return 0
+    return Mail.objects.filter(id__in=mail_ids).update(
+        status=status, attempted_at=timezone.now())
+
+
+def recipient_name(user: Optional[User]) -> str:
+    if user is None:
+        return ''
+    return f'{user.name} {user.surname}'
 
 
-def create_model(subject: str, body: str, email: str, user: Optional[User] = None) -> Mail:
+def get_template_version(name: str) -> MailTemplate:
+    """
+       Stored version of the current template file, one row per distinct source
+    """
+    compiled = registry.get(name)
+    template = _template_versions.get(compiled.digest)
+    if template is None:
+        template, _ = MailTemplate.objects.get_or_create(
+            digest=compiled.digest,
+            defaults={'name': name, 'source': compiled.source},
+        )
+        _template_versions[compiled.digest] = template
+    return template
+
+
+def create_model(subject: str, template: str, variables: dict, email: str,
+                 user: Optional[User] = None) -> Mail:
     """
-       Create Mail model 
+       Create Mail model. Stores template version and variables instead of
+       the rendered body unless MAIL_STORE_RENDERED_BODY is set
     """
-    mail = Mail.objects.create(
+    if settings.MAIL_STORE_RENDERED_BODY:
+        return Mail.objects.create(
+            user=user,
+            subject=subject,
+            body=registry.render(template, variables),
+            email=email,
+        )
+
+    return Mail.objects.create(
         user=user,
         subject=subject,
-        body=body,
+        template=get_template_version(template),
+        variables=variables,
         email=email,
     )
-    mail.save()
-    return mail
+
+
+def deliver(mail: Mail):
+    """
+       Send mail now or leave it to the batch sender
+    """
+    if settings.MAIL_BATCH_ENABLED:
+        enqueue_for_batch()
+        return
+
+    res = single_sender_wrapper(mail.subject, mail.render_body(), mail.email,
+                                recipient_name(mail.user))
+
+    set_status([mail.id], MailStatus.SENT if res else MailStatus.FAILED)
 
 
 # --------------  Handlers ---------------- #
@@ -84,28 +212,16 @@ def verify_email_handler(user: User, code: str, url=f'{settings.FRONTEND_VERIFY_
        Send verification code for verify email
     """
     SUBJECT = f'Verify you email for {settings.PROJECT_NAME}'
-    TEMPLATE = 'mail/templates/verify_email.html'
-
-    # Load the email template
-    with open(TEMPLATE, 'r') as f:
-        body = f.read()
+    TEMPLATE = 'verify_email.html'
 
     # Variables for replace
     variables = {
-        '{{code}}': code,
-        '{{url}}': url,
+        'code': code,
+        'url': url,
     }
 
-    body = body_replace(body, variables)
-
-    mail = create_model(SUBJECT, body, user.email, user)
-
-    res = single_sender_wrapper(SUBJECT, body, user.email,
-                                f'{user.name} {user.surname}')
-
-    if res:
-        mail.is_send = True
-        mail.save()
+    mail = create_model(SUBJECT, TEMPLATE, variables, user.email, user)
+    deliver(mail)
 
 
 def password_reset_request_handler(user: User, code: str, url=f'{settings.FRONTEND_VERIFY_EMAIL_URL}'):
@@ -113,28 +229,13 @@ def password_reset_request_handler(user: User, code: str, url=f'{settings.FRONTE
        Send verification code for reset password
     """
     SUBJECT = f'Reset your password for {settings.PROJECT_NAME}'
-    TEMPLATE = 'mail/templates/reset_password.html'
-
-    # Load the email template
-    with open(TEMPLATE, 'r') as f:
-        body = f.read()
+    TEMPLATE = 'reset_password.html'
 
     # Variables for replace
-    print('code: ', code)
     variables = {
-        '{{code}}': code,
-        '{{url}}': url,
+        'code': code,
+        'url': url,
     }
 
-    print('body: 1: ', body)
-    body = body_replace(body, variables)
-    print('body: 2: ', body)
-
-    mail = create_model(SUBJECT, body, user.email, user)
-
-    res = single_sender_wrapper(SUBJECT, body, user.email,
-                                f'{user.name} {user.surname}')
-
-    if res:
-        mail.is_send = True
-        mail.save()
+    mail = create_model(SUBJECT, TEMPLATE, variables, user.email, user)
+    deliver(mail)
@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from mail.registry import TemplateRegistry, TEMPLATES_DIR, LOGO_PATH
+
+
+def _legacy_render(template: str, variables: dict) -> str:
+    """
+        Previous behaviour: read template and logo from disk, one copy per variable
+    """
+    with open(f'{TEMPLATES_DIR}/{template}', 'r') as f:
+        body = f.read()
+    for key, value in variables.items():
+        body = body.replace('{{%s}}' % key, str(value))
+    with open(LOGO_PATH, 'rb') as logo_file:
+        logo_file.read()
+    return body
+
+
+def _registry_render(registry: TemplateRegistry, template: str, variables: dict) -> str:
+    body = registry.render(template, variables)
+    registry.logo()
+    return body
+
+
+class Command(BaseCommand):
+    help = 'Compare renders per second of mail templates before and after the template registry'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000)
+        parser.add_argument('--template', default='verify_email.html')
+
+    def _measure(self, label, func, iterations):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        elapsed = time.perf_counter() - start
+        rate = iterations / elapsed
+        self.stdout.write(f'{label:<10} {rate:>12,.0f} renders/sec ({elapsed:.3f}s)')
+        return rate
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        template = options['template']
+        variables = {'code': 'A1B2C3', 'url': 'https://example.com/verify-email'}
+        registry = TemplateRegistry()
+
+        if _legacy_render(template, variables) != registry.render(template, variables):
+            self.stderr.write('Rendered bodies differ')
+            return
+
+        before = self._measure(
+            'before', lambda: _legacy_render(template, variables), iterations)
+        after = self._measure(
+            'after', lambda: _registry_render(registry, template, variables), iterations)
+        self.stdout.write(self.style.SUCCESS(f'speedup    {after / before:.1f}x'))
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from mail import partitions
+
+
+class Command(BaseCommand):
+    help = 'Create upcoming monthly partitions of the mail table and purge expired ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=settings.MAIL_PARTITION_MONTHS_AHEAD)
+        parser.add_argument('--retention', type=int, default=settings.MAIL_RETENTION_MONTHS,
+                            help='Months of mail to keep, 0 disables purge')
+        parser.add_argument('--detach-only', action='store_true',
+                            help='Detach expired partitions without dropping them')
+
+    def handle(self, *args, **options):
+        if not partitions.is_partitioned():
+            self.stderr.write('Mail table is not partitioned')
+            return
+
+        today = timezone.now().date()
+        for name in partitions.ensure_partitions(today, options['months_ahead']):
+            self.stdout.write(f'ensured {name}')
+
+        if options['retention'] > 0:
+            purged = partitions.purge_partitions(
+                today, options['retention'], drop=not options['detach_only'])
+            for name in purged:
+                self.stdout.write(self.style.WARNING(f'purged {name}'))
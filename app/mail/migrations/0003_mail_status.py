@@ -0,0 +1,49 @@
+# Generated by Django 4.2.3 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+def is_send_to_status(apps, schema_editor):
+    Mail = apps.get_model('mail', 'Mail')
+    Mail.objects.filter(is_send=True).update(status='sent')
+    # Unsent rows from the old flow were failed sends, don't pick them up again
+    Mail.objects.filter(is_send=False).update(status='failed')
+
+
+def status_to_is_send(apps, schema_editor):
+    Mail = apps.get_model('mail', 'Mail')
+    Mail.objects.filter(status='sent').update(is_send=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mail', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mail',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('sent', 'Sent'), ('failed', 'Failed')], default='queued', max_length=16, verbose_name='Status'),
+        ),
+        migrations.AddField(
+            model_name='mail',
+            name='attempted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Attempted at'),
+        ),
+        migrations.RunPython(is_send_to_status, status_to_is_send),
+        migrations.RemoveField(
+            model_name='mail',
+            name='is_send',
+        ),
+        migrations.AlterField(
+            model_name='mail',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, verbose_name='Created at'),
+        ),
+        migrations.AddIndex(
+            model_name='mail',
+            index=models.Index(fields=['status', 'created_at'], name='mail_status_created_idx'),
+        ),
+    ]
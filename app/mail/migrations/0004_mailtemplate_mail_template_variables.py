@@ -0,0 +1,39 @@
+# Generated by Django 4.2.3 on 2026-10-18 10:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mail', '0003_mail_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MailTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(editable=False, max_length=64, unique=True)),
+                ('name', models.CharField(max_length=255, verbose_name='Name')),
+                ('source', models.TextField(editable=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='mail',
+            name='body',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='mail',
+            name='template',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='mails', to='mail.mailtemplate', verbose_name='Template'),
+        ),
+        migrations.AddField(
+            model_name='mail',
+            name='variables',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
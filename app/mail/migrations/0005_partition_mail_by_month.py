@@ -0,0 +1,122 @@
+# Generated by Django 4.2.3 on 2026-10-18 10:00
+
+import uuid
+from datetime import date
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from mail import partitions
+
+COLUMNS = (
+    'id, uid, email, status, attempted_at, subject, body, created_at, '
+    'user_id, template_id, variables'
+)
+
+
+def partition_mail_table(apps, schema_editor):
+    """
+    Rebuild mail_mail as a table range-partitioned by month of created_at.
+    The primary key and uid constraint include created_at as PostgreSQL
+    requires for partitioned tables, Migration.operations keeps the model
+    state in line with them.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute('''
+            CREATE SEQUENCE mail_mail_part_id_seq;
+            CREATE TABLE mail_mail_part (
+                id bigint NOT NULL DEFAULT nextval('mail_mail_part_id_seq'),
+                uid uuid NOT NULL,
+                email varchar(255) NOT NULL,
+                status varchar(16) NOT NULL,
+                attempted_at timestamp with time zone NULL,
+                subject varchar(500) NOT NULL,
+                body text NOT NULL,
+                created_at timestamp with time zone NOT NULL,
+                user_id bigint NULL
+                    REFERENCES user_user (id) DEFERRABLE INITIALLY DEFERRED,
+                template_id bigint NULL
+                    REFERENCES mail_mailtemplate (id) DEFERRABLE INITIALLY DEFERRED,
+                variables jsonb NOT NULL,
+                CONSTRAINT mail_mail_part_pkey PRIMARY KEY (id, created_at),
+                CONSTRAINT mail_mail_part_uid_created_at_uniq UNIQUE (uid, created_at)
+            ) PARTITION BY RANGE (created_at);
+            CREATE TABLE mail_mail_default PARTITION OF mail_mail_part DEFAULT;
+        ''')
+        cursor.execute('SELECT MIN(created_at) FROM mail_mail')
+        first = cursor.fetchone()[0]
+
+    today = date.today()
+    month = partitions.month_start(first.date() if first else today)
+    last = partitions.add_months(partitions.month_start(today), 2)
+    while month <= last:
+        partitions.create_partition(month, connection, table='mail_mail_part')
+        month = partitions.add_months(month, 1)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'''
+            INSERT INTO mail_mail_part ({COLUMNS}) SELECT {COLUMNS} FROM mail_mail;
+            SELECT setval('mail_mail_part_id_seq', COALESCE((SELECT MAX(id) FROM mail_mail_part), 0) + 1, false);
+            DROP TABLE mail_mail;
+            ALTER TABLE mail_mail_part RENAME TO mail_mail;
+            ALTER TABLE mail_mail RENAME CONSTRAINT mail_mail_part_pkey TO mail_mail_pkey;
+            ALTER TABLE mail_mail RENAME CONSTRAINT mail_mail_part_uid_created_at_uniq
+                TO mail_mail_uid_created_at_uniq;
+            ALTER SEQUENCE mail_mail_part_id_seq OWNED BY mail_mail.id;
+            CREATE INDEX mail_status_created_idx ON mail_mail (status, created_at);
+            CREATE INDEX mail_mail_user_id_idx ON mail_mail (user_id);
+            CREATE INDEX mail_mail_template_id_idx ON mail_mail (template_id);
+        ''')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mail', '0004_mailtemplate_mail_template_variables'),
+        ('user', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # The state can't hold the composite primary key (id, created_at),
+        # everything else matches the table created above
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(partition_mail_table, elidable=False),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='mail',
+                    name='uid',
+                    field=models.UUIDField(default=uuid.uuid4, editable=False),
+                ),
+                migrations.AlterField(
+                    model_name='mail',
+                    name='user',
+                    field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='mail_user', to=settings.AUTH_USER_MODEL, verbose_name='User'),
+                ),
+                migrations.AlterField(
+                    model_name='mail',
+                    name='template',
+                    field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='mails', to='mail.mailtemplate', verbose_name='Template'),
+                ),
+                migrations.AddIndex(
+                    model_name='mail',
+                    index=models.Index(fields=['user'], name='mail_mail_user_id_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='mail',
+                    index=models.Index(fields=['template'], name='mail_mail_template_id_idx'),
+                ),
+                migrations.AddConstraint(
+                    model_name='mail',
+                    constraint=models.UniqueConstraint(fields=('uid', 'created_at'), name='mail_mail_uid_created_at_uniq'),
+                ),
+            ],
+        ),
+    ]
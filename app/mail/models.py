@@ -2,27 +2,83 @@ from django.utils.translation import gettext_lazy as _
 from django.db import models
 from uuid import uuid4
 
+from mail.enums import MailStatus
+from mail.registry import registry
+
+
+class MailTemplate(models.Model):
+    """Template version stored once and addressed by sha256 of its source"""
+    digest = models.CharField(max_length=64, unique=True, editable=False)
+    name = models.CharField(max_length=255, verbose_name=_('Name'))
+    source = models.TextField(editable=False)
+    created_at = models.DateTimeField(
+        verbose_name=_('Created at'),
+        auto_now_add=True, editable=False
+    )
+
+    def __str__(self) -> str:
+        return f'{self.name} ({self.digest[:8]})'
+
 
 class Mail(models.Model):
-    uid = models.UUIDField(unique=True, default=uuid4, editable=False)
+    uid = models.UUIDField(default=uuid4, editable=False)
     user = models.ForeignKey(
         'user.User',
         on_delete=models.CASCADE,
         verbose_name=_('User'),
         related_name='mail_user',
         blank=True, null=True,
+        db_index=False,
     )
     email = models.CharField(max_length=255)
-    is_send = models.BooleanField(default=False)
+    status = models.CharField(
+        max_length=16,
+        choices=MailStatus.choices,
+        default=MailStatus.QUEUED,
+        verbose_name=_('Status'),
+    )
+    attempted_at = models.DateTimeField(
+        verbose_name=_('Attempted at'),
+        null=True, blank=True, editable=False,
+    )
     subject = models.CharField(
         max_length=500, verbose_name=_('Subject')
     )
-    body = models.TextField()
+    body = models.TextField(blank=True, default='')
+    template = models.ForeignKey(
+        MailTemplate,
+        on_delete=models.PROTECT,
+        verbose_name=_('Template'),
+        related_name='mails',
+        blank=True, null=True,
+        db_index=False,
+    )
+    variables = models.JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(
         verbose_name=_('Created at'),
-        auto_now=True, editable=False
+        auto_now_add=True, editable=False
     )
 
+    class Meta:
+        # Table is range-partitioned by created_at (migration 0005), so the
+        # database enforces primary key and uid uniqueness together with it:
+        # the real primary key is (id, created_at), which Django can't declare.
+        # Index and constraint names match the ones created by the migration
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='mail_status_created_idx'),
+            models.Index(fields=['user'], name='mail_mail_user_id_idx'),
+            models.Index(fields=['template'], name='mail_mail_template_id_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=('uid', 'created_at'), name='mail_mail_uid_created_at_uniq'),
+        ]
+
     def __str__(self) -> str:
         return f'{self.email}'
 
+    def render_body(self) -> str:
+        """Stored body, or body rendered from template version and variables"""
+        if self.template_id is None:
+            return self.body
+        template = self.template
+        return registry.compile(template.digest, template.source).render(self.variables)
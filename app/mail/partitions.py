@@ -0,0 +1,91 @@
+"""Monthly range partitions of the mail_mail table (PostgreSQL only)"""
+import re
+from datetime import date
+from typing import List
+
+from django.db import connection as default_connection
+
+TABLE = 'mail_mail'
+PARTITION_RE = re.compile(rf'^{TABLE}_y(\d{{4}})m(\d{{2}})$')
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(day: date, months: int) -> date:
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f'{TABLE}_y{month.year:04d}m{month.month:02d}'
+
+
+def is_partitioned(connection=default_connection) -> bool:
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass', [TABLE])
+        return cursor.fetchone() is not None
+
+
+def list_partitions(connection=default_connection) -> List[str]:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits '
+            'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+            'WHERE pg_inherits.inhparent = %s::regclass', [TABLE])
+        return sorted(row[0] for row in cursor.fetchall())
+
+
+def create_partition(month: date, connection=default_connection, table: str = TABLE) -> str:
+    """
+        Create partition holding rows of the given month if it does not exist
+    """
+    month = month_start(month)
+    name = partition_name(month)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} '
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+        )
+    return name
+
+
+def ensure_partitions(today: date, months_ahead: int, connection=default_connection) -> List[str]:
+    """
+        Create partitions from the current month up to `months_ahead` months
+    """
+    if not is_partitioned(connection):
+        return []
+    current = month_start(today)
+    return [create_partition(add_months(current, i), connection) for i in range(months_ahead + 1)]
+
+
+def purge_partitions(today: date, retention_months: int, drop: bool = True,
+                     connection=default_connection) -> List[str]:
+    """
+        Detach (and drop) partitions whose whole month is older than retention.
+        Costs a catalog change per month instead of a DELETE over its rows
+    """
+    if not is_partitioned(connection):
+        return []
+
+    cutoff = add_months(month_start(today), -retention_months)
+    purged = []
+    for name in list_partitions(connection):
+        match = PARTITION_RE.match(name)
+        if match is None:
+            continue
+        month = date(int(match.group(1)), int(match.group(2)), 1)
+        if add_months(month, 1) > cutoff:
+            continue
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {name}')
+            if drop:
+                cursor.execute(f'DROP TABLE {name}')
+        purged.append(name)
+    return purged
@@ -0,0 +1,134 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from typing import Dict, Optional
+
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+LOGO_PATH = os.path.join(TEMPLATES_DIR, 'files', 'logo.png')
+
+# Matches {{code}}, {{ logo }} etc. Unknown names are left in place, so
+# {{ logo }} survives rendering and is filled with the CID at send time.
+PLACEHOLDER_RE = re.compile(r'{{\s*(\w+)\s*}}')
+
+
+class CompiledTemplate:
+    """
+        Template split once into literal chunks and placeholder slots
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self.digest = hashlib.sha256(source.encode()).hexdigest()
+        self._parts = []
+        self._slots = []
+        position = 0
+        for match in PLACEHOLDER_RE.finditer(source):
+            self._parts.append(source[position:match.start()])
+            # Slot keeps the raw placeholder as a fallback for unknown names
+            self._slots.append((len(self._parts), match.group(1)))
+            self._parts.append(match.group(0))
+            position = match.end()
+        self._parts.append(source[position:])
+
+    @property
+    def names(self):
+        return {name for _, name in self._slots}
+
+    def render(self, variables: dict) -> str:
+        """
+            Fill every placeholder in a single pass
+        """
+        parts = list(self._parts)
+        for i, name in self._slots:
+            if name in variables:
+                parts[i] = str(variables[name])
+        return ''.join(parts)
+
+
+class _CachedFile:
+    def __init__(self, value, mtime_ns: int):
+        self.value = value
+        self.mtime_ns = mtime_ns
+        self.checked_at = time.monotonic()
+
+
+class TemplateRegistry:
+    """
+        Process-wide cache of compiled mail templates and inline files.
+        Files are re-read only when their mtime changes; the mtime itself is
+        checked at most once per `check_interval` seconds.
+    """
+
+    def __init__(self, base_dir: str = TEMPLATES_DIR, check_interval: float = 1.0):
+        self.base_dir = base_dir
+        self.check_interval = check_interval
+        self._cache: Dict[str, _CachedFile] = {}
+        self._compiled: Dict[str, CompiledTemplate] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, name: str) -> str:
+        if os.path.isabs(name):
+            return name
+        return os.path.join(self.base_dir, name)
+
+    def _load(self, path: str, loader):
+        cached = self._cache.get(path)
+        now = time.monotonic()
+        if cached is not None and now - cached.checked_at < self.check_interval:
+            return cached.value
+
+        with self._lock:
+            cached = self._cache.get(path)
+            mtime_ns = os.stat(path).st_mtime_ns
+            if cached is None or cached.mtime_ns != mtime_ns:
+                cached = _CachedFile(loader(path), mtime_ns)
+                self._cache[path] = cached
+            else:
+                cached.checked_at = now
+            return cached.value
+
+    def get(self, name: str) -> CompiledTemplate:
+        """
+            Return compiled template by file name relative to templates dir
+        """
+        def loader(path):
+            with open(path, 'r') as f:
+                return CompiledTemplate(f.read())
+
+        return self._load(self._path(name), loader)
+
+    def get_bytes(self, name: str) -> bytes:
+        """
+            Return raw file content, e.g. inline images
+        """
+        def loader(path):
+            with open(path, 'rb') as f:
+                return f.read()
+
+        return self._load(self._path(name), loader)
+
+    def compile(self, digest: str, source: str) -> CompiledTemplate:
+        """
+            Return compiled template for stored source, cached by its digest
+        """
+        compiled = self._compiled.get(digest)
+        if compiled is None:
+            compiled = self._compiled[digest] = CompiledTemplate(source)
+        return compiled
+
+    def render(self, name: str, variables: Optional[dict] = None) -> str:
+        return self.get(name).render(variables or {})
+
+    def logo(self) -> bytes:
+        return self.get_bytes(LOGO_PATH)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._compiled.clear()
+
+
+registry = TemplateRegistry()
@@ -1,7 +1,14 @@
+import uuid
+
 from celery import shared_task
 
+from django.utils import timezone
+
+from core.redis import redis_storage, release_lock
 from user import models as user_models
-from mail import handlers
+from mail import handlers, partitions
+
+import settings
 
 
 @shared_task(name="send_verify_email")
@@ -19,3 +26,29 @@ def send_password_reset_request_email_task(user_id: int, code: str):
         return
 
     handlers.password_reset_request_handler(user, code)
+
+
+@shared_task(name="send_mail_batch")
+def send_mail_batch_task():
+    lock_key = 'running_tasks:send_mail_batch'
+    lock_token = uuid.uuid4().hex
+    if not redis_storage.connection.set(lock_key, lock_token, nx=True, ex=300):
+        # Another flush is running, pick up what it may miss after the window
+        send_mail_batch_task.apply_async(countdown=settings.MAIL_BATCH_WINDOW)
+        return
+
+    try:
+        redis_storage.connection.delete(handlers.BATCH_PENDING_KEY)
+        handlers.send_pending_mails()
+    finally:
+        # The lock may have expired and been taken by another flush
+        release_lock(redis_storage.connection, lock_key, lock_token)
+
+
+@shared_task(name="maintain_mail_partitions")
+def maintain_mail_partitions_task():
+    today = timezone.now().date()
+    partitions.ensure_partitions(today, settings.MAIL_PARTITION_MONTHS_AHEAD)
+    if settings.MAIL_RETENTION_MONTHS > 0:
+        partitions.purge_partitions(
+            today, settings.MAIL_RETENTION_MONTHS, drop=settings.MAIL_RETENTION_DROP)
@@ -0,0 +1,19 @@
+from django.core import mail as outbox
+from django.test import TestCase, override_settings
+
+from mail import handlers
+from mail.enums import MailStatus
+from mail.models import Mail
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class SendPendingMailsTests(TestCase):
+
+    def test_every_queued_mail_is_sent_once(self):
+        for i in range(5):
+            Mail.objects.create(email=f'user{i}@example.com', subject='Hi', body='Hello')
+
+        self.assertEqual(handlers.send_pending_mails(batch_size=2), 5)
+        self.assertEqual(len(outbox.outbox), 5)
+        self.assertEqual(Mail.objects.filter(status=MailStatus.SENT).count(), 5)
+        self.assertEqual(handlers.send_pending_mails(batch_size=2), 0)
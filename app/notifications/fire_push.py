@@ -1,14 +1,37 @@
-import firebase_admin
-from firebase_admin.messaging import Message, Notification, send
+import threading
 
 from notifications.schemas import FirePush
 
-push_app = firebase_admin.initialize_app()
+# firebase_admin and its google-cloud dependencies are imported on first push,
+# not when the web process starts
+_push_app = None
+_lock = threading.Lock()
+
+
+def get_app():
+    global _push_app
+    if _push_app is None:
+        with _lock:
+            if _push_app is None:
+                import firebase_admin
+                _push_app = firebase_admin.initialize_app()
+    return _push_app
+
+
+def reset_app():
+    """Recreate the app in a forked worker, its HTTP session can't be shared"""
+    global _push_app
+    if _push_app is not None:
+        import firebase_admin
+        firebase_admin.delete_app(_push_app)
+        _push_app = None
 
 # !!! DOCS: https://github.com/firebase/firebase-admin-python/blob/master/snippets/messaging/cloud_messaging.py
 
 
 def send_push(fire_push: FirePush):
+    from firebase_admin.messaging import Message, Notification, send
+
     if not fire_push.data.get('click_action'):
         fire_push.data['click_action'] = 'FLUTTER_NOTIFICATION_CLICK'
 
@@ -21,6 +44,6 @@ def send_push(fire_push: FirePush):
         data=fire_push.data
     )
 
-    send(message)
+    send(message, app=get_app())
 
   # TODO: add notification model
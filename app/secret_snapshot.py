@@ -0,0 +1,118 @@
+"""
+Secret Manager settings payload with a local snapshot. Imported by settings.py
+before Django is configured, so it only uses the standard library until a
+fetch is really needed.
+
+A snapshot younger than SECRETS_CACHE_TTL is used as is. An older one is
+still used for startup (up to SECRETS_MAX_STALE) while a background thread
+checks the latest version and refreshes the file for the next start; only a
+missing or too old snapshot blocks startup on Secret Manager. With
+SECRETS_OFFLINE=1 the network is never touched.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Optional, Tuple
+
+
+class SecretSnapshot:
+    def __init__(self, secret: str = None, path: str = None, ttl: int = None,
+                 max_stale: int = None, offline: bool = None):
+        self.secret = secret or os.environ.get('SETTINGS_NAME', 'django-settings')
+        self.path = path or os.environ.get('SECRETS_CACHE_PATH') or os.path.join(
+            tempfile.gettempdir(), f'{self.secret}.snapshot.json')
+        self.ttl = ttl if ttl is not None else int(os.environ.get('SECRETS_CACHE_TTL', 60 * 60))
+        self.max_stale = max_stale if max_stale is not None else int(
+            os.environ.get('SECRETS_MAX_STALE', 7 * 24 * 60 * 60))
+        self.offline = offline if offline is not None else bool(
+            int(os.environ.get('SECRETS_OFFLINE', False)))
+        self.source = None
+        self.refresh_thread = None
+
+    # Snapshot file
+
+    def read(self) -> Optional[dict]:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write(self, version: str, payload: str):
+        snapshot = {'secret': self.secret, 'version': version,
+                    'fetched_at': time.time(), 'payload': payload}
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        # Readable by the owner only, replaced atomically for concurrent workers
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.secrets-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(snapshot, f)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, self.path)
+        return snapshot
+
+    # Secret Manager
+
+    def _client(self):
+        from google.cloud import secretmanager
+        return secretmanager.SecretManagerServiceClient()
+
+    def _version_path(self, version: str = 'latest') -> str:
+        project_id = os.environ.get('GOOGLE_CLOUD_PROJECT')
+        if not project_id:
+            import google.auth
+            _, project_id = google.auth.default()
+            os.environ['GOOGLE_CLOUD_PROJECT'] = project_id
+        return f'projects/{project_id}/secrets/{self.secret}/versions/{version}'
+
+    def latest_version(self, client) -> str:
+        """Resolved number of the latest version, metadata only"""
+        return client.get_secret_version(name=self._version_path()).name.rsplit('/', 1)[-1]
+
+    def fetch(self, snapshot: Optional[dict] = None) -> dict:
+        """
+        Refresh the snapshot. The payload is downloaded only when the latest
+        version differs from the snapshot's
+        """
+        client = self._client()
+        version = self.latest_version(client)
+        if snapshot is not None and snapshot.get('version') == version:
+            return self.write(version, snapshot['payload'])
+        response = client.access_secret_version(name=self._version_path(version))
+        return self.write(version, response.payload.data.decode('UTF-8'))
+
+    def _refresh(self, snapshot):
+        try:
+            self.fetch(snapshot)
+        except Exception as e:
+            print('Secret snapshot refresh error:', e)
+
+    # Loading
+
+    def load(self) -> Tuple[Optional[str], str]:
+        """Settings payload and where it came from"""
+        snapshot = self.read()
+        age = time.time() - snapshot['fetched_at'] if snapshot else None
+
+        if self.offline:
+            self.source = 'snapshot (offline)' if snapshot else 'none (offline)'
+        elif snapshot is not None and age < self.ttl:
+            self.source = 'snapshot'
+        elif snapshot is not None and age < self.max_stale:
+            self.source = 'stale snapshot, refreshing'
+            self.refresh_thread = threading.Thread(
+                target=self._refresh, args=(snapshot,), name='secret-refresh', daemon=True)
+            self.refresh_thread.start()
+        else:
+            try:
+                snapshot = self.fetch(snapshot)
+                self.source = 'secret manager'
+            except Exception as e:
+                if snapshot is None:
+                    raise
+                print('Secret Manager unavailable, using old snapshot:', e)
+                self.source = 'old snapshot'
+
+        return (snapshot['payload'] if snapshot else None), self.source
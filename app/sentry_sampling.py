@@ -0,0 +1,109 @@
+"""
+Sentry traces sampling policy. Imported by settings.py before Django is
+configured, so it only uses the standard library.
+
+Requests are traced at the rate of the longest matching path prefix and
+tasks at the rate of their name, falling back to the default rates. The
+sampler only sees a transaction when it starts, so errors and slow runs are
+handled tail-first: the middleware and celery signals report every finished
+request and task with `record()`, and a route or task which failed or took
+longer than its threshold is traced at `boost_rate` for `boost_seconds`.
+Error events are sent regardless of the traces rate.
+"""
+import re
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+# Numeric and uuid path segments, so /api/book/12/ and /api/book/13/ share a key
+ID_SEGMENT = re.compile(r'/(\d+|[0-9a-fA-F-]{32,36})(?=/|$)')
+MAX_BOOSTED = 1024
+
+
+class TracesSampler:
+    def __init__(self, default_rate: float = 0.0, task_rate: float = None,
+                 route_rates: Dict[str, float] = None, task_rates: Dict[str, float] = None,
+                 slow_request: float = 1.0, slow_task: float = 30.0,
+                 boost_rate: float = 1.0, boost_seconds: float = 60,
+                 clock: Callable[[], float] = time.monotonic):
+        self.default_rate = default_rate
+        self.task_rate = default_rate if task_rate is None else task_rate
+        # Longest prefix first, so the most specific one matches
+        self.route_rates = sorted((route_rates or {}).items(), key=lambda item: -len(item[0]))
+        self.task_rates = task_rates or {}
+        self.slow_request = slow_request
+        self.slow_task = slow_task
+        self.boost_rate = boost_rate
+        self.boost_seconds = boost_seconds
+        self.clock = clock
+        self._boosted = {}
+        self._lock = threading.Lock()
+
+    # Keys and rates
+
+    @staticmethod
+    def route_key(path: str) -> str:
+        return ID_SEGMENT.sub('/:id', path)
+
+    @staticmethod
+    def task_key(name: str) -> str:
+        return f'task:{name}'
+
+    def route_rate(self, path: str) -> float:
+        for prefix, rate in self.route_rates:
+            if path.startswith(prefix):
+                return rate
+        return self.default_rate
+
+    def _request_path(self, sampling_context: dict) -> str:
+        environ = sampling_context.get('wsgi_environ')
+        if environ:
+            return environ.get('PATH_INFO', '')
+        scope = sampling_context.get('asgi_scope')
+        if scope:
+            return scope.get('path', '')
+        return (sampling_context.get('transaction_context') or {}).get('name') or ''
+
+    # Tail feedback
+
+    def record(self, key: str, duration: float, error: bool = False, threshold: float = None):
+        """Boost the key when the finished run failed or was slower than the threshold"""
+        if not error and (threshold is None or duration < threshold):
+            return
+        now = self.clock()
+        with self._lock:
+            if len(self._boosted) >= MAX_BOOSTED:
+                self._boosted = {k: until for k, until in self._boosted.items() if until > now}
+            self._boosted[key] = now + self.boost_seconds
+
+    def record_request(self, path: str, duration: float, error: bool = False):
+        self.record(self.route_key(path), duration, error, self.slow_request)
+
+    def record_task(self, name: str, duration: float, error: bool = False):
+        self.record(self.task_key(name), duration, error, self.slow_task)
+
+    def is_boosted(self, key: str) -> bool:
+        until = self._boosted.get(key)
+        return until is not None and until > self.clock()
+
+    # Sentry hook
+
+    def sample_rate(self, key: str, rate: float) -> float:
+        # A zero rate turns tracing off for good, boosting doesn't bring it back
+        if rate > 0 and self.is_boosted(key):
+            return max(rate, self.boost_rate)
+        return rate
+
+    def __call__(self, sampling_context: dict) -> float:
+        parent_sampled: Optional[bool] = sampling_context.get('parent_sampled')
+        if parent_sampled is not None:
+            # Keep traces started by another service whole
+            return float(parent_sampled)
+
+        job = sampling_context.get('celery_job')
+        if job:
+            name = job.get('task', '')
+            return self.sample_rate(self.task_key(name), self.task_rates.get(name, self.task_rate))
+
+        path = self._request_path(sampling_context)
+        return self.sample_rate(self.route_key(path), self.route_rate(path))
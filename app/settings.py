@@ -1,12 +1,18 @@
+import time
+_import_started = time.perf_counter()
+
 import io
 import os
-import google.auth
 import environ
 from datetime import timedelta
-from google.cloud import secretmanager
 
 import sentry_sdk
+from sentry_sdk.integrations.celery import CeleryIntegration
 from sentry_sdk.integrations.django import DjangoIntegration
+from sentry_sdk.integrations.redis import RedisIntegration
+
+from secret_snapshot import SecretSnapshot
+from sentry_sampling import TracesSampler
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -34,22 +40,14 @@ IS_DEVELOPMENT = bool(int(os.environ.get('IS_DEVELOPMENT', False)))
 DEBUG = bool(int(os.environ.get('DEBUG', False)))
 
 
-try:
-    _, os.environ['GOOGLE_CLOUD_PROJECT'] = google.auth.default()
-    print('Success auth by google', os.environ['GOOGLE_CLOUD_PROJECT'])
-except google.auth.exceptions.DefaultCredentialsError:
-    pass
-
+SECRETS_SOURCE = 'env'
 if not IS_DEVELOPMENT:
-    # Pull secrets from Secret Manager
-    project_id = os.environ.get('GOOGLE_CLOUD_PROJECT')
-
-    client = secretmanager.SecretManagerServiceClient()
-    settings_name = os.environ.get('SETTINGS_NAME', 'django-settings')
-    name = f'projects/{project_id}/secrets/{settings_name}/versions/latest'
-    payload = client.access_secret_version(
-        name=name).payload.data.decode('UTF-8')
-    print(payload, 'settings loaded')
+    # Secrets from Secret Manager through a local snapshot, see secret_snapshot.py
+    payload, SECRETS_SOURCE = SecretSnapshot().load()
+    if payload is None:
+        # Never start production on the fallback secrets below
+        raise RuntimeError(f'No settings payload ({SECRETS_SOURCE}), '
+                           f'set IS_DEVELOPMENT=1 or provide a secrets snapshot')
     env.read_env(io.StringIO(payload))
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = os.environ.get(
@@ -105,7 +103,15 @@ CACHES = {
     }
 }
 
+# Authenticated user cache, see user/cache.py
+USER_CACHE_TIMEOUT = 300
+# In-process layer can't be invalidated from other workers, keep it short
+USER_LOCAL_CACHE_TTL = 5
+USER_LOCAL_CACHE_SIZE = 1024
+
 MIDDLEWARE = [
+    # First, so the measured time covers the other middleware too
+    'core.middleware.TraceSamplingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -139,13 +145,16 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'wsgi.application'
+ASGI_APPLICATION = 'asgi.application'
+# wsgi or asgi, picks the gunicorn worker and whether async clients are kept per event loop
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi')
 X_FRAME_OPTIONS = 'SAMEORIGIN'
 
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'core.pagination.DefaultPager',
     'PAGE_SIZE': 100,
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'user.authentication.CachedJWTAuthentication',
     ],
     # Errors standardized
     'EXCEPTION_HANDLER': 'drf_standardized_errors.handler.exception_handler',
@@ -153,6 +162,12 @@ REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
 
+# Total count of paginated lists: 'exact', 'cached' or 'estimated'.
+# Views override it with `count_strategy`, see core/counting.py
+PAGINATION_COUNT_STRATEGY = os.environ.get('PAGINATION_COUNT_STRATEGY', 'exact')
+PAGINATION_COUNT_CACHE_TIMEOUT = 60
+PAGINATION_ESTIMATE_THRESHOLD = 10000
+
 # Errors standardized
 DRF_STANDARDIZED_ERRORS = {'ENABLE_IN_DEBUG_FOR_UNHANDLED_EXCEPTIONS': True}
 
@@ -185,10 +200,15 @@ SPECTACULAR_SETTINGS = {
 # COMMAND FOR CREATE SCHEMA
 # docker-compose exec app python manage.py spectacular --color --file schema.yml
 
+# Buffer last_login in Redis and flush it every LAST_LOGIN_FLUSH_INTERVAL
+# seconds instead of an UPDATE per login, see user/last_login.py
+LAST_LOGIN_BUFFERED = bool(int(os.environ.get('LAST_LOGIN_BUFFERED', True)))
+LAST_LOGIN_FLUSH_INTERVAL = int(os.environ.get('LAST_LOGIN_FLUSH_INTERVAL', 30))
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=30),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=365),
-    'UPDATE_LAST_LOGIN': True,
+    'UPDATE_LAST_LOGIN': not LAST_LOGIN_BUFFERED,
 }
 
 AUTHENTICATION_BACKENDS = (
@@ -212,6 +232,27 @@ else:
 
 DATABASES = {'default': db}
 
+# ---------------- PASSWORDS -------------- #
+# First hasher of the profile is used for new hashes, the rest only verify
+# old ones which are rehashed on next login. argon2, scrypt and pbkdf2 release
+# the GIL, so request threads hash in parallel. See user/hashers.py
+PASSWORD_HASHER_PROFILES = {
+    'argon2': 'user.hashers.TunedArgon2PasswordHasher',
+    'scrypt': 'user.hashers.TunedScryptPasswordHasher',
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+}
+PASSWORD_HASHER_PROFILE = os.environ.get('PASSWORD_HASHER_PROFILE', 'argon2')
+PASSWORD_HASHERS = [PASSWORD_HASHER_PROFILES[PASSWORD_HASHER_PROFILE]] + [
+    hasher for profile, hasher in PASSWORD_HASHER_PROFILES.items()
+    if profile != PASSWORD_HASHER_PROFILE
+]
+ARGON2_TIME_COST = int(os.environ.get('ARGON2_TIME_COST', 2))
+ARGON2_MEMORY_COST = int(os.environ.get('ARGON2_MEMORY_COST', 19456))  # KiB
+ARGON2_PARALLELISM = int(os.environ.get('ARGON2_PARALLELISM', 1))
+SCRYPT_WORK_FACTOR = int(os.environ.get('SCRYPT_WORK_FACTOR', 2 ** 15))
+SCRYPT_BLOCK_SIZE = int(os.environ.get('SCRYPT_BLOCK_SIZE', 8))
+SCRYPT_PARALLELISM = int(os.environ.get('SCRYPT_PARALLELISM', 1))
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -248,9 +289,51 @@ AUTH_USER_MODEL = 'user.User'
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
 
 GOOGLE_AUTH_BASE_URL = 'https://www.googleapis.com/oauth2/v3/userinfo?alt=json'
+# (connect, read) seconds, userinfo is cached by token hash
+GOOGLE_TOKEN_HTTP_TIMEOUT = (2, 5)
+GOOGLE_TOKEN_CACHE_TIMEOUT = 300
+GOOGLE_TOKEN_INVALID_CACHE_TIMEOUT = 30
+
+# Shared session for external APIs, see core/http.py
+HTTP_TIMEOUT = (3, 10)
+HTTP_POOL_CONNECTIONS = 10
+HTTP_POOL_MAXSIZE = 20
+HTTP_MAX_RETRIES = 1
+# Connections of the async client per event loop (ASGI worker)
+HTTP_ASYNC_MAX_CONNECTIONS = 200
+
+# Seconds between worker stats snapshots in Redis, see core/worker_stats.py
+WORKER_STATS_INTERVAL = 10
+
 FACEBOOK_AUTH_BASE_URL = 'https://graph.facebook.com/v12.0/me/?fields=email,id,name'
 APPLE_AUTH_BASE_URl = '?scope=name%20email%20sub'
 
+# Signed ID tokens are verified locally against the provider JWKS.
+# Audiences are the app's client ids, tokens for other apps are rejected
+SOCIAL_ID_TOKEN_PROVIDERS = {
+    'google': {
+        'jwks_url': 'https://www.googleapis.com/oauth2/v3/certs',
+        'issuers': ['https://accounts.google.com', 'accounts.google.com'],
+        'audiences': [aud for aud in os.environ.get('GOOGLE_CLIENT_IDS', '').split(',') if aud],
+    },
+    'apple': {
+        'jwks_url': 'https://appleid.apple.com/auth/keys',
+        'issuers': ['https://appleid.apple.com'],
+        'audiences': [aud for aud in os.environ.get('APPLE_CLIENT_IDS', '').split(',') if aud],
+    },
+    'facebook': {
+        'jwks_url': 'https://www.facebook.com/.well-known/oauth/openid/jwks/',
+        'issuers': ['https://www.facebook.com'],
+        'audiences': [aud for aud in os.environ.get('FACEBOOK_APP_IDS', '').split(',') if aud],
+    },
+}
+ID_TOKEN_LEEWAY = 30
+# Key sets are kept JWKS_CACHE_TIMEOUT seconds and refreshed in the background
+# after JWKS_REFRESH_AFTER; unknown kids refetch at most every JWKS_MISS_INTERVAL
+JWKS_CACHE_TIMEOUT = 6 * 60 * 60
+JWKS_REFRESH_AFTER = 60 * 60
+JWKS_MISS_INTERVAL = 60
+
 DEFAULT_FILE_STORAGE = os.environ.get('STORAGE')
 STATICFILES_STORAGE = os.environ.get('STATIC_STORAGE')
 GS_STATIC_BUCKET_NAME = os.environ.get('GS_STATIC_BUCKET_NAME')
@@ -264,6 +347,19 @@ STATIC_URL = os.environ.get(
 STATIC_ROOT = os.environ.get('STORAGE_STATIC_ROOT')
 
 MAX_UPLOAD_SIZE = 5242880
+# Store streamed uploads under a sharded content hash, identical files once
+MEDIA_CONTENT_HASH_PATHS = bool(int(os.environ.get('MEDIA_CONTENT_HASH_PATHS', False)))
+# Seconds a content addressed upload is protected from deletion until it's saved
+MEDIA_HOLD_TIMEOUT = 300
+
+# Avatar variants built by the process_avatar task: name -> square side in px
+AVATAR_VARIANTS = {
+    'small': 96,
+    'medium': 256,
+    'large': 512,
+}
+AVATAR_FORMATS = ('webp', 'jpeg')
+AVATAR_QUALITY = 82
 
 # --------- CELERY TASKS SCHEDULE --------- #
 CELERY_BEAT_SCHEDULE = {
@@ -271,6 +367,18 @@ CELERY_BEAT_SCHEDULE = {
     #     'task': 'celery_test_task',
     #     'schedule': timedelta(minutes=1)
     # }
+    'send-mail-batch-every-minute': {
+        'task': 'send_mail_batch',
+        'schedule': timedelta(minutes=1)
+    },
+    'maintain-mail-partitions-daily': {
+        'task': 'maintain_mail_partitions',
+        'schedule': timedelta(days=1)
+    },
+    'flush-last-login': {
+        'task': 'flush_last_login',
+        'schedule': timedelta(seconds=LAST_LOGIN_FLUSH_INTERVAL)
+    },
 }
 
 # ------------- CELERY TASKS -------------- #
@@ -280,16 +388,53 @@ CELERY_TASK_ROUTES = {
 
     'send_verify_email': {'queue': 'main-queue'},
     'send_password_reset_request_email': {'queue': 'main-queue'},
+    'send_mail_batch': {'queue': 'main-queue'},
+    'maintain_mail_partitions': {'queue': 'main-queue'},
+    'flush_last_login': {'queue': 'main-queue'},
+    'process_avatar': {'queue': 'main-queue'},
     'send_fire_push': {'queue': 'main-queue'},
 }
 
 
 # ----------------- SENTRY ---------------- #
 SENTRY_DSN = os.environ.get('SENTRY_DSN')
+# Share of requests and tasks traced, see sentry_sampling.py
+SENTRY_TRACES_SAMPLE_RATE = float(os.environ.get('SENTRY_TRACES_SAMPLE_RATE', 0.05))
+SENTRY_TRACES_TASK_SAMPLE_RATE = float(os.environ.get('SENTRY_TRACES_TASK_SAMPLE_RATE', 0.1))
+# Longest matching path prefix wins, 0 turns tracing off
+SENTRY_TRACES_ROUTE_RATES = {
+    '/api/core/': 0,  # polled stats endpoints
+    '/api/user/auth/': 0.2,
+    '/api/user/registration/': 0.5,
+    '/admin/': 0,
+}
+SENTRY_TRACES_TASK_RATES = {
+    'celery_test_task': 0,
+    'maintain_mail_partitions': 1.0,
+}
+# Routes and tasks which failed or ran longer (seconds) are traced at
+# SENTRY_TRACES_BOOST_RATE for the next SENTRY_TRACES_BOOST_SECONDS
+SENTRY_TRACES_SLOW_REQUEST = float(os.environ.get('SENTRY_TRACES_SLOW_REQUEST', 1))
+SENTRY_TRACES_SLOW_TASK = float(os.environ.get('SENTRY_TRACES_SLOW_TASK', 30))
+SENTRY_TRACES_BOOST_RATE = float(os.environ.get('SENTRY_TRACES_BOOST_RATE', 1))
+SENTRY_TRACES_BOOST_SECONDS = int(os.environ.get('SENTRY_TRACES_BOOST_SECONDS', 5 * 60))
+SENTRY_TRACES_SAMPLER = TracesSampler(
+    default_rate=SENTRY_TRACES_SAMPLE_RATE,
+    task_rate=SENTRY_TRACES_TASK_SAMPLE_RATE,
+    route_rates=SENTRY_TRACES_ROUTE_RATES,
+    task_rates=SENTRY_TRACES_TASK_RATES,
+    slow_request=SENTRY_TRACES_SLOW_REQUEST,
+    slow_task=SENTRY_TRACES_SLOW_TASK,
+    boost_rate=SENTRY_TRACES_BOOST_RATE,
+    boost_seconds=SENTRY_TRACES_BOOST_SECONDS,
+)
 sentry_sdk.init(
     dsn=SENTRY_DSN,
-    integrations=[DjangoIntegration()],
-    traces_sample_rate=1.0,
+    # Listed explicitly: auto-enabled integrations import every supported
+    # library that is installed (httpx), defeating lazy imports
+    integrations=[DjangoIntegration(), CeleryIntegration(), RedisIntegration()],
+    auto_enabling_integrations=False,
+    traces_sampler=SENTRY_TRACES_SAMPLER,
     send_default_pii=True,
 )
 
@@ -299,8 +444,44 @@ REDIS_PASSWORD = os.environ.get('REDIS_PASSWORD')
 REDIS_SERVER = os.environ.get('REDIS_SERVER')
 REDIS_APP_DB = os.environ.get('REDIS_APP_DB')
 CELERY_BROKER_URL = f'redis://:{REDIS_PASSWORD}@{REDIS_SERVER}/{REDIS_APP_DB}'
+
+# Connection limits shared by app pools (core/redis.py), cache and celery
+REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', 20))
+# Seconds to wait for a free pooled connection before raising ConnectionError
+REDIS_POOL_TIMEOUT = float(os.environ.get('REDIS_POOL_TIMEOUT', 5))
+REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', 5))
+REDIS_SOCKET_CONNECT_TIMEOUT = float(os.environ.get('REDIS_SOCKET_CONNECT_TIMEOUT', 2))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.environ.get('REDIS_HEALTH_CHECK_INTERVAL', 30))
+REDIS_POOLS = {
+    'default': {'db': REDIS_APP_DB, 'decode_responses': True},
+}
+CACHES['default']['OPTIONS'].update({
+    'SOCKET_TIMEOUT': REDIS_SOCKET_TIMEOUT,
+    'SOCKET_CONNECT_TIMEOUT': REDIS_SOCKET_CONNECT_TIMEOUT,
+    'CONNECTION_POOL_CLASS': 'redis.BlockingConnectionPool',
+    'CONNECTION_POOL_KWARGS': {
+        'max_connections': REDIS_MAX_CONNECTIONS,
+        'timeout': REDIS_POOL_TIMEOUT,
+        'health_check_interval': REDIS_HEALTH_CHECK_INTERVAL,
+    },
+})
+CELERY_BROKER_POOL_LIMIT = REDIS_MAX_CONNECTIONS
+CELERY_REDIS_MAX_CONNECTIONS = REDIS_MAX_CONNECTIONS
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'socket_timeout': REDIS_SOCKET_TIMEOUT,
+    'socket_connect_timeout': REDIS_SOCKET_CONNECT_TIMEOUT,
+    'health_check_interval': REDIS_HEALTH_CHECK_INTERVAL,
+}
 RESET_TOKEN_LENGTH = 5
 RESET_CODE_EXPIRE = 3600
+# Verification codes, see user/verification.py. 'redis' or 'memory'
+VERIFICATION_CODE_BACKEND = os.environ.get('VERIFICATION_CODE_BACKEND', 'redis')
+VERIFICATION_CODE_MAX_ATTEMPTS = 5
+VERIFICATION_CODE_RESEND_COOLDOWN = 60
+# Run on-commit side effects (codes, task publishing) in a background thread
+BACKGROUND_DISPATCH = bool(int(os.environ.get('BACKGROUND_DISPATCH', True)))
+# Seconds an exiting worker waits for queued side effects
+DISPATCH_DRAIN_TIMEOUT = int(os.environ.get('DISPATCH_DRAIN_TIMEOUT', 10))
 
 
 # ---------------- TWILIO ----------------- #
@@ -311,3 +492,26 @@ TWILIO_SERVICE_UID = os.environ.get('TWILIO_SERVICE_UID')
 # ---------------- EMAILS ----------------- #
 SENDGRID_KEY = os.environ.get('SENDGRID_KEY')
 DEFAULT_EMAIL_FROM = os.environ.get('DEFAULT_EMAIL_FROM')
+# Send mails in batches through one connection instead of one per task
+MAIL_BATCH_ENABLED = bool(int(os.environ.get('MAIL_BATCH_ENABLED', True)))
+MAIL_BATCH_SIZE = int(os.environ.get('MAIL_BATCH_SIZE', 50))
+# Seconds to collect mails before flushing a batch
+MAIL_BATCH_WINDOW = int(os.environ.get('MAIL_BATCH_WINDOW', 2))
+# Unsent mails older than this are not picked up (codes expire anyway)
+MAIL_BATCH_MAX_AGE = RESET_CODE_EXPIRE
+# Keep full html in Mail.body instead of template version + variables
+MAIL_STORE_RENDERED_BODY = bool(int(os.environ.get('MAIL_STORE_RENDERED_BODY', False)))
+# Mail table is partitioned by month, see mail/partitions.py
+MAIL_PARTITION_MONTHS_AHEAD = int(os.environ.get('MAIL_PARTITION_MONTHS_AHEAD', 2))
+# Months of mail to keep, 0 keeps everything
+MAIL_RETENTION_MONTHS = int(os.environ.get('MAIL_RETENTION_MONTHS', 12))
+# Drop expired partitions, otherwise only detach them for manual archiving
+MAIL_RETENTION_DROP = bool(int(os.environ.get('MAIL_RETENTION_DROP', True)))
+
+# Upper bound for imports done by django.setup(), see core/tests/test_import_time.py.
+# Only checked with IMPORT_TIME_CHECK=1, timings vary between machines
+IMPORT_TIME_BUDGET_MS = int(os.environ.get('IMPORT_TIME_BUDGET_MS', 1500))
+
+# Wall time of importing this module, secrets included. Not printed, every
+# worker and management command imports settings and stdout may be piped
+SETTINGS_IMPORT_TIME = time.perf_counter() - _import_started
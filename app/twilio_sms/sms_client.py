@@ -1,18 +1,32 @@
-from twilio.rest import Client
-from twilio.rest.verify.v2.service import ServiceContext
+from typing import TYPE_CHECKING
 
 import settings
 # from twilio_sms import enums as sms_enums
 
+if TYPE_CHECKING:
+    from twilio.rest import Client
+    from twilio.rest.verify.v2.service import ServiceContext
 
-class SmsClient:
-    def __init__(self):
-        self.client = Client(
+_client = None
+
+
+def get_twilio_client() -> 'Client':
+    """Shared Twilio client, twilio is imported on first use"""
+    global _client
+    if _client is None:
+        from twilio.rest import Client
+        _client = Client(
             settings.TWILIO_ACCOUNT_SID,
             settings.TWILIO_AUTH_TOKEN
         )
+    return _client
+
+
+class SmsClient:
+    def __init__(self):
+        self.client = get_twilio_client()
 
-    def _get_service(self) -> ServiceContext:
+    def _get_service(self) -> 'ServiceContext':
         return self.client.verify.services(settings.TWILIO_SERVICE_UID)
 
     def send_sms_verification(self, phone_number: str) -> bool:
@@ -19,6 +19,7 @@ swagger_patterns = path('api/schema/', include([
 # API patterns
 api_patterns = path('api/', include([
     path('user/', include('user.urls')),
+    path('core/', include('core.urls')),
     # path('twilio/', include('twilio_sms.urls')),
 ]))
 
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.contrib.auth.hashers import identify_hasher
 
 from user import models
 
@@ -25,6 +26,14 @@ class UserAdmin(admin.ModelAdmin):
     def save_model(self, request, obj, form, change):
         if not obj.password:
             obj.save()
-        if obj.password and not obj.password.startswith('pbkdf2_sha256'):
+        if obj.password and not _is_hashed(obj.password):
             obj.set_password(obj.password)
-        obj.save()
\ No newline at end of file
+        obj.save()
+
+
+def _is_hashed(password):
+    try:
+        identify_hasher(password)
+    except ValueError:
+        return False
+    return True
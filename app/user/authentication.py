@@ -0,0 +1,48 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from user import cache
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication which loads the token user through user.cache instead of
+    a primary key SELECT on every request
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        user = cache.get_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        return user
+
+
+def get_token_user_id(request):
+    """
+    User id from a valid access token in the request, without loading the user
+    """
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    if header is None:
+        return None
+
+    raw_token = authentication.get_raw_token(header)
+    if raw_token is None:
+        return None
+
+    try:
+        validated_token = authentication.get_validated_token(raw_token)
+    except InvalidToken:
+        return None
+    return validated_token.get(api_settings.USER_ID_CLAIM)
@@ -0,0 +1,184 @@
+"""
+Avatar variants. A celery task stores a copy of the upload without EXIF and
+other metadata, points the avatar at it and resizes it to
+settings.AVATAR_VARIANTS in every AVATAR_FORMATS format, clients pick the
+smallest one that fits instead of the original.
+"""
+import hashlib
+import os
+from io import BytesIO
+from typing import TYPE_CHECKING, Dict, Iterable, Tuple
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from core import media
+from core.models import content_hash_path
+from user import cache
+from user.models import User
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+# Image.info keys which may carry location or device details
+METADATA_KEYS = ('exif', 'xmp', 'XML:com.adobe.xmp', 'comment')
+
+
+def variant_name(name: str, variant: str, fmt: str) -> str:
+    """Variant files live next to the original, e.g. a/b/c_small.webp"""
+    root, _ = os.path.splitext(name)
+    return f'{root}_{variant}.{EXTENSIONS[fmt]}'
+
+
+def _encode(image: 'Image.Image', fmt: str) -> bytes:
+    from PIL import Image
+
+    if fmt == 'jpeg' and image.mode != 'RGB':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+        image = background
+    buffer = BytesIO()
+    # No exif argument, so no metadata is written to the new file
+    image.save(buffer, format=fmt.upper(), quality=settings.AVATAR_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def _save(name: str, content: bytes) -> str:
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    return default_storage.save(name, ContentFile(content))
+
+
+def _has_metadata(image: 'Image.Image') -> bool:
+    return bool(image.getexif()) or any(key in image.info for key in METADATA_KEYS)
+
+
+def _open(name: str) -> 'Image.Image':
+    from PIL import Image
+
+    with default_storage.open(name, 'rb') as f:
+        image = Image.open(f)
+        image.load()
+    return image
+
+
+def _strip(image: 'Image.Image') -> bytes:
+    from PIL import ImageOps
+
+    original_format = image.format or 'PNG'
+    # Apply the orientation tag before it's dropped with the rest of EXIF
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    buffer = BytesIO()
+    # No exif argument, so no metadata is written to the new file
+    options = {'quality': 95} if original_format == 'JPEG' else {}
+    image.save(buffer, format=original_format, **options)
+    return buffer.getvalue()
+
+
+def strip_metadata(name: str) -> Tuple[str, 'Image.Image']:
+    """
+    Name of a copy of the upload without metadata, and its image. An image
+    without metadata is used as it is, so the copy is encoded only once and
+    rebuilding variants never re-encodes it. Content addressed copies are
+    stored under their own hash and held until media.release()
+    """
+    image = _open(name)
+    if not _has_metadata(image):
+        return name, image
+    content = _strip(image)
+    if settings.MEDIA_CONTENT_HASH_PATHS:
+        stripped = content_hash_path(name, hashlib.sha256(content).hexdigest(), prefix='user')
+        media.save_once(default_storage, stripped, ContentFile(content))
+    else:
+        # The storage picks a free name next to the upload
+        stripped = default_storage.save(name, ContentFile(content))
+    return stripped, _open(stripped)
+
+
+def build_variants(name: str, image: 'Image.Image' = None) -> Dict[str, Dict[str, str]]:
+    """
+    Write all variants of the image stored under name.
+    Returns {variant: {format: storage name}}
+    """
+    # Pillow is only needed by the celery task, not by the web process
+    from PIL import Image, ImageOps
+
+    image = image or _open(name)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+    variants = {}
+    for variant, size in settings.AVATAR_VARIANTS.items():
+        resized = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        variants[variant] = {
+            fmt: _save(variant_name(name, variant, fmt), _encode(resized, fmt))
+            for fmt in settings.AVATAR_FORMATS
+        }
+    return variants
+
+
+def variant_names(variants: dict) -> Iterable[str]:
+    for formats in (variants or {}).values():
+        yield from formats.values()
+
+
+def _shared_variants(user_id: int, name: str) -> dict:
+    """Variants of the same original built for another user, see MEDIA_CONTENT_HASH_PATHS"""
+    return (User.objects.filter(avatar=name).exclude(id=user_id).exclude(avatar_variants={})
+            .values_list('avatar_variants', flat=True).first()) or {}
+
+
+def _delete_unused(original: str, names: Iterable[str]):
+    # Content addressed originals and their variants may belong to several
+    # users, and an upload in progress may have just reused the original
+    if not original:
+        return
+    media.delete_unused(default_storage, original, User.objects.filter(avatar=original).exists, names)
+
+
+def _process(user_id: int, name: str):
+    stripped, image = strip_metadata(name)
+    try:
+        variants = _shared_variants(user_id, stripped) or build_variants(stripped, image)
+        updated = User.objects.filter(id=user_id, avatar=name).update(
+            avatar=stripped, avatar_variants=variants)
+        cache.invalidate_user(user_id)
+    finally:
+        if stripped != name and settings.MEDIA_CONTENT_HASH_PATHS:
+            media.release(stripped)
+
+    if not updated:
+        # Replaced meanwhile, the new upload's task removes the upload itself
+        _delete_unused(stripped, [stripped, *variant_names(variants)])
+    elif stripped != name:
+        # The upload still has its metadata
+        _delete_unused(name, [name])
+
+
+def process_avatar(user_id: int, name: str, stale: Iterable[str] = (), previous: str = None):
+    """
+    Build variants for the uploaded avatar. Skipped when the user uploaded
+    another avatar meanwhile, that upload has its own task. The previous
+    avatar and its variants are removed either way
+    """
+    try:
+        if User.objects.filter(id=user_id, avatar=name).exists():
+            _process(user_id, name)
+    finally:
+        _delete_unused(previous, [previous, *stale])
+
+
+def variant_urls(variants: dict, request=None) -> Dict[str, Dict[str, str]]:
+    urls = {}
+    for variant, formats in (variants or {}).items():
+        urls[variant] = {}
+        for fmt, name in formats.items():
+            url = default_storage.url(name)
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls[variant][fmt] = url
+    return urls
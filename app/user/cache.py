@@ -0,0 +1,87 @@
+import copy
+import time
+from typing import TYPE_CHECKING, Iterable, Optional
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from core.cache import LocalLRUCache
+
+if TYPE_CHECKING:
+    from user.models import User
+
+# The password hash never leaves the database, it's loaded on access
+DEFERRED_FIELDS = ('password',)
+
+local_users = LocalLRUCache(
+    maxsize=settings.USER_LOCAL_CACHE_SIZE,
+    ttl=settings.USER_LOCAL_CACHE_TTL,
+)
+
+
+def _key(user_id) -> str:
+    return f'user:auth:{user_id}'
+
+
+def get_user(user_id) -> Optional['User']:
+    """
+    User by id from the in-process LRU, then Redis, then the database.
+    Returns a copy so request code can't mutate the cached instance.
+    Deferred fields are read from the database when they are accessed
+    """
+    key = _key(user_id)
+    user = local_users.get(key)
+    if user is None:
+        user = cache.get(key)
+        if user is None:
+            User = apps.get_model('user', 'User')
+            user = User.objects.defer(*DEFERRED_FIELDS).filter(id=user_id).first()
+            if user is None:
+                return None
+            cache.set(key, user, settings.USER_CACHE_TIMEOUT)
+        local_users.set(key, user)
+    return copy.copy(user)
+
+
+def get_user_version(user_id) -> int:
+    """
+    Version of the user row for ETags. Starts from the current time when
+    missing, so a lost key never repeats a version a client has seen.
+    """
+    key = f'user:version:{user_id}'
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_user(user_id):
+    """
+    Drop cached user and bump its version. Call after queryset update()s,
+    which don't send post_save.
+    """
+    invalidate_users([user_id])
+
+
+def _delete(user_ids: list):
+    keys = []
+    for user_id in user_ids:
+        local_users.delete(_key(user_id))
+        keys += [_key(user_id), f'user:version:{user_id}']
+    if keys:
+        cache.delete_many(keys)
+
+
+def invalidate_users(user_ids: Iterable):
+    """
+    invalidate_user() for many users, e.g. after bulk_update(). Inside a
+    transaction it's done again on commit, requests reading the old row
+    before the commit would cache it again otherwise
+    """
+    user_ids = list(user_ids)
+    _delete(user_ids)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _delete(user_ids))
@@ -1,4 +1,230 @@
-from user.models import User
+"""
+Google sign-in. Access tokens are resolved to userinfo through the shared
+HTTP session (or the async client in async views); results are cached in
+Redis by token hash and concurrent lookups of the same token wait for a
+single request.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+import uuid
+import weakref
+from typing import Optional
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from core import aio
+from core.http import async_http_client, http_session
+from core.redis import RELEASE_LOCK_SCRIPT, redis_pools
+from user import provisioning
+
+
+class TokenServiceUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Token verification service is unavailable, try again later'
+    default_code = 'token_service_unavailable'
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class GoogleTokenClient:
+    """
+    :param timeout: cache time of a valid token's userinfo, capped by the
+        token's own expiry when Google reports it
+    """
+    INVALID = {}
+    # Statuses meaning the token itself is bad, anything else isn't cached
+    INVALID_STATUSES = (400, 401)
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, url: str = None, timeout: int = None, invalid_timeout: int = None):
+        self.url = url or settings.GOOGLE_AUTH_BASE_URL
+        self.timeout = timeout or settings.GOOGLE_TOKEN_CACHE_TIMEOUT
+        self.invalid_timeout = invalid_timeout or settings.GOOGLE_TOKEN_INVALID_CACHE_TIMEOUT
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._async_inflight = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def _key(token: str) -> str:
+        # Tokens themselves are never written to Redis
+        return f'google:token:{hashlib.sha256(token.encode()).hexdigest()}'
+
+    @property
+    def _wait_time(self) -> float:
+        connect_timeout, read_timeout = settings.GOOGLE_TOKEN_HTTP_TIMEOUT
+        return connect_timeout + read_timeout
+
+    def _parse(self, response) -> dict:
+        # requests and httpx responses share this interface
+        if response.status_code in self.INVALID_STATUSES:
+            return self.INVALID
+        if response.status_code >= 400:
+            # Rate limits and server errors say nothing about the token
+            print('Google auth error:', response.status_code, response.content)
+            raise TokenServiceUnavailable()
+        try:
+            data = response.json()
+        except ValueError:
+            print('Google auth error: not a JSON response', response.status_code)
+            raise TokenServiceUnavailable()
+        return data if isinstance(data, dict) and 'sub' in data else self.INVALID
+
+    def _cache_time(self, data: dict) -> int:
+        if data is self.INVALID:
+            return self.invalid_timeout
+        timeout = self.timeout
+        if 'exp' in data:
+            timeout = min(timeout, int(data['exp']) - int(time.time()))
+        return timeout
+
+    # Sync API
+
+    def userinfo(self, token: str) -> Optional[dict]:
+        """Userinfo for a valid access token, None for an invalid one"""
+        if not token:
+            return None
+        key = self._key(token)
+        cached = redis_pools.client().get(key)
+        if cached is not None:
+            data = json.loads(cached)
+        else:
+            data = self._coalesce(key, lambda: self._fetch_shared(key, token))
+        return data or None
+
+    def _coalesce(self, key, func):
+        # Threads of this process asking for the same token share one call
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            call.event.set()
+
+    def _fetch_shared(self, key, token) -> dict:
+        # Other processes wait for the one holding the lock to fill the cache
+        client = redis_pools.client()
+        lock_key = f'{key}:lock'
+        lock_token = uuid.uuid4().hex
+        locked = client.set(lock_key, lock_token, nx=True, ex=int(self._wait_time) + 1)
+        if not locked:
+            deadline = time.monotonic() + self._wait_time
+            while time.monotonic() < deadline:
+                time.sleep(self.POLL_INTERVAL)
+                cached = client.get(key)
+                if cached is not None:
+                    return json.loads(cached)
+        try:
+            try:
+                response = http_session().get(
+                    self.url, headers={'Authorization': f'Bearer {token}'},
+                    timeout=settings.GOOGLE_TOKEN_HTTP_TIMEOUT)
+            except requests.RequestException as e:
+                print('Google auth error:', e)
+                raise TokenServiceUnavailable()
+            data = self._parse(response)
+            timeout = self._cache_time(data)
+            if timeout > 0:
+                client.set(key, json.dumps(data), ex=timeout)
+            return data
+        finally:
+            # A waiter which timed out doesn't own the lock
+            if locked:
+                client.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, lock_token)
+
+    # Async API, for views running on the event loop
+
+    async def auserinfo(self, token: str) -> Optional[dict]:
+        if not token:
+            return None
+        if not aio.loop_clients_enabled():
+            # Pooled sync clients, the loop of a WSGI request lives for one request
+            return await sync_to_async(self.userinfo)(token)
+        key = self._key(token)
+        cached = await redis_pools.async_client().get(key)
+        if cached is not None:
+            data = json.loads(cached)
+        else:
+            data = await self._acoalesce(key, token)
+        return data or None
+
+    async def _acoalesce(self, key, token) -> dict:
+        # Tasks of this event loop asking for the same token share one call
+        inflight = self._async_inflight.setdefault(asyncio.get_running_loop(), {})
+        future = inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = inflight[key] = asyncio.ensure_future(self._afetch_shared(key, token))
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if future.done():
+                inflight.pop(key, None)
+            else:
+                future.add_done_callback(lambda _: inflight.pop(key, None))
+
+    async def _afetch_shared(self, key, token) -> dict:
+        client = redis_pools.async_client()
+        lock_key = f'{key}:lock'
+        lock_token = uuid.uuid4().hex
+        locked = await client.set(lock_key, lock_token, nx=True, ex=int(self._wait_time) + 1)
+        if not locked:
+            deadline = time.monotonic() + self._wait_time
+            while time.monotonic() < deadline:
+                await asyncio.sleep(self.POLL_INTERVAL)
+                cached = await client.get(key)
+                if cached is not None:
+                    return json.loads(cached)
+        try:
+            import httpx
+
+            connect_timeout, read_timeout = settings.GOOGLE_TOKEN_HTTP_TIMEOUT
+            try:
+                response = await async_http_client().get(
+                    self.url, headers={'Authorization': f'Bearer {token}'},
+                    timeout=httpx.Timeout(read_timeout, connect=connect_timeout))
+            except httpx.HTTPError as e:
+                print('Google auth error:', e)
+                raise TokenServiceUnavailable()
+            data = self._parse(response)
+            timeout = self._cache_time(data)
+            if timeout > 0:
+                await client.set(key, json.dumps(data), ex=timeout)
+            return data
+        finally:
+            if locked:
+                await client.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, lock_token)
+
+
+google_token_client = GoogleTokenClient()
 
 
 class GoogleUser(object):
@@ -11,11 +237,8 @@ class GoogleUser(object):
         self.family_name = google_response['family_name']
 
     def get_user(self):
-        user, created = User.objects.get_or_create(email=self.email)
-        user.google_id = self.id
-        user.is_email_verified = True
-        if created:
-            user.name = self.given_name
-            user.surname = self.family_name
-        user.save()
+        user, created = provisioning.get_or_create_social_user(
+            self.email, self.USER_FIELD_NAME, self.id,
+            defaults={'name': self.given_name, 'surname': self.family_name},
+        )
         return user
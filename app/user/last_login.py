@@ -0,0 +1,65 @@
+"""
+Buffered last_login: logins are recorded in a Redis hash and flushed to the
+database in one bulk UPDATE by the flush_last_login beat task. The hash is
+renamed to a processing key first and deleted only after the UPDATE, a
+failed flush merges it back.
+"""
+from datetime import datetime, timezone
+
+import redis
+
+from core.redis import redis_storage
+from user import cache
+from user.models import User
+
+# Hash tag keeps both keys in one slot, RENAME needs that on Redis Cluster
+LAST_LOGIN_KEY = '{user:last_login}'
+PROCESSING_KEY = '{user:last_login}:processing'
+
+# Put timestamps back unless a newer login was recorded meanwhile
+MERGE_BACK_SCRIPT = """
+local items = redis.call('HGETALL', KEYS[2])
+for i = 1, #items, 2 do
+    local current = redis.call('HGET', KEYS[1], items[i])
+    if not current or tonumber(current) < tonumber(items[i + 1]) then
+        redis.call('HSET', KEYS[1], items[i], items[i + 1])
+    end
+end
+redis.call('DEL', KEYS[2])
+return #items / 2
+"""
+
+
+def record(user_id: int, when: datetime = None):
+    when = when or datetime.now(timezone.utc)
+    redis_storage.connection.hset(LAST_LOGIN_KEY, user_id, when.timestamp())
+
+
+def flush(batch_size: int = 1000) -> int:
+    """
+    Move buffered timestamps to the user table, return count of updated users
+    """
+    client = redis_storage.connection
+    try:
+        # Fails when a previous flush died with its batch, that one goes first
+        client.renamenx(LAST_LOGIN_KEY, PROCESSING_KEY)
+    except redis.ResponseError:
+        # Nothing buffered
+        pass
+    buffered = client.hgetall(PROCESSING_KEY)
+    if not buffered:
+        return 0
+
+    users = [
+        User(id=int(user_id), last_login=datetime.fromtimestamp(float(timestamp), timezone.utc))
+        for user_id, timestamp in buffered.items()
+    ]
+    try:
+        User.objects.bulk_update(users, ['last_login'], batch_size=batch_size)
+    except Exception:
+        client.eval(MERGE_BACK_SCRIPT, 2, LAST_LOGIN_KEY, PROCESSING_KEY)
+        raise
+    client.delete(PROCESSING_KEY)
+    # bulk_update sends no post_save
+    cache.invalidate_users(user.id for user in users)
+    return len(users)
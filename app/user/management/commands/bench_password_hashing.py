@@ -0,0 +1,49 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+
+class Command(BaseCommand):
+    help = 'Report password verifications (logins) per second per core for each hasher profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=3.0)
+        parser.add_argument('--profile', action='append', dest='profiles',
+                            help='Profile to measure, defaults to all')
+        parser.add_argument('--threads', type=int, default=os.cpu_count(),
+                            help='Threads verifying at once, like a gthread worker')
+
+    def _rate(self, func, seconds):
+        count, start = 0, time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            func()
+            count += 1
+        return count / (time.perf_counter() - start)
+
+    def _threaded_rate(self, func, seconds, threads):
+        with ThreadPoolExecutor(threads) as executor:
+            return sum(executor.map(lambda _: self._rate(func, seconds), range(threads)))
+
+    def handle(self, *args, **options):
+        seconds = options['seconds']
+        threads = options['threads']
+        profiles = options['profiles'] or list(settings.PASSWORD_HASHER_PROFILES)
+        password = 'benchmark-password-1'
+
+        self.stdout.write(f'{"profile":<10} {"logins/sec/core":>16} {"threads logins/sec":>19}')
+        for profile in profiles:
+            hasher = import_string(settings.PASSWORD_HASHER_PROFILES[profile])()
+            encoded = hasher.encode(password, hasher.salt())
+            verify = lambda: hasher.verify(password, encoded)  # noqa: E731
+            per_core = self._rate(verify, seconds)
+            # The hashers release the GIL, so this scales with cores
+            threaded = self._threaded_rate(verify, seconds, threads)
+            self.stdout.write(f'{profile:<10} {per_core:>16,.1f} {threaded:>19,.1f}')
+
+        self.stdout.write(
+            f'cpu count {os.cpu_count()}, threads {threads}, default hasher {get_hasher().algorithm}')
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.3 on 2026-10-18 11:46
+
+import core.validators
+from django.db import migrations, models
+
+
+def empty_email_to_null(apps, schema_editor):
+    User = apps.get_model('user', 'User')
+    User.objects.filter(email='').update(email=None)
+
+
+def null_email_to_empty(apps, schema_editor):
+    User = apps.get_model('user', 'User')
+    User.objects.filter(email__isnull=True).update(email='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0002_user_avatar_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='email',
+            field=models.EmailField(blank=True, error_messages={'unique': 'email_already_used'}, max_length=255, null=True, unique=True, validators=[core.validators.email_validator], verbose_name='Email'),
+        ),
+        migrations.RunPython(empty_email_to_null, null_email_to_empty),
+    ]
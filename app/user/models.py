@@ -45,6 +45,9 @@ class User(AbstractBaseUser, PermissionsMixin):
     uid = models.UUIDField(unique=True, default=uuid4, editable=False)
     email = models.EmailField(
         max_length=255,
+        # NULL for phone users, unique doesn't apply to NULLs
+        null=True,
+        blank=True,
         unique=True,
         error_messages={'unique': "email_already_used"},
         verbose_name = _("Email"),
@@ -81,6 +84,13 @@ class User(AbstractBaseUser, PermissionsMixin):
         validators=[validate_file_size],
         verbose_name=_('Avatar'),
     )
+    avatar_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name=_('Avatar variants'),
+        help_text=_('Resized copies of the avatar, filled by a background task'),
+    )
     created_at = models.DateTimeField(
         auto_now_add=True,
         editable=False,
@@ -0,0 +1,76 @@
+"""
+User provisioning in one INSERT ... ON CONFLICT statement. Password hashes
+are computed before the statement, so registration and social login take a
+single database round trip and concurrent duplicates can't race.
+"""
+from typing import Optional, Tuple
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+
+from user import cache
+from user.models import User
+
+
+def _upsert(user: User, on_conflict: str, params=()) -> Tuple[Optional[User], bool]:
+    fields = [field for field in User._meta.concrete_fields if not field.primary_key]
+    all_fields = User._meta.concrete_fields
+    qn = connection.ops.quote_name
+
+    values = [field.get_db_prep_save(field.pre_save(user, add=True), connection)
+              for field in fields]
+    sql = (
+        f'INSERT INTO {qn(User._meta.db_table)} '
+        f'({", ".join(qn(field.column) for field in fields)}) '
+        f'VALUES ({", ".join(["%s"] * len(fields))}) {on_conflict} '
+        # xmax is 0 only for a row inserted by this statement
+        f'RETURNING {", ".join(qn(field.column) for field in all_fields)}, (xmax = 0)'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, values + list(params))
+        row = cursor.fetchone()
+
+    if row is None:
+        return None, False
+    # Raw rows skip query converters, e.g. JSONField still holds a string
+    row = [field.from_db_value(value, None, connection) if hasattr(field, 'from_db_value') else value
+           for field, value in zip(all_fields, row[:-1])] + [row[-1]]
+    user = User.from_db(connection.alias, [field.attname for field in all_fields], row[:-1])
+    return user, row[-1]
+
+
+def create_user(password: str, **fields) -> Optional[User]:
+    """
+    Insert a new user, returns None when email or phone is already registered
+    """
+    # Phone users have no email, store NULL so they don't conflict on ''
+    fields['email'] = User.objects.normalize_email(fields['email']) if fields.get('email') else None
+    user = User(password=make_password(password), **fields)
+    user, _ = _upsert(user, 'ON CONFLICT DO NOTHING')
+    return user
+
+
+def get_or_create_social_user(email: str, social_field: str = None, social_id: str = None,
+                              defaults: dict = None) -> Tuple[User, bool]:
+    """
+    Insert user for a verified social email, or mark the existing one as
+    verified and link the social id
+    """
+    qn = connection.ops.quote_name
+    assignments = [f'{qn("is_email_verified")} = TRUE']
+    params = []
+    field_names = {field.name for field in User._meta.concrete_fields}
+    if social_field in field_names:
+        assignments.append(f'{qn(social_field)} = %s')
+        params.append(social_id)
+
+    fields = dict(defaults or {}, email=email, is_email_verified=True)
+    if social_field in field_names:
+        fields[social_field] = social_id
+    user = User(password=make_password(None), **fields)
+
+    user, created = _upsert(
+        user, f'ON CONFLICT ({qn("email")}) DO UPDATE SET {", ".join(assignments)}', params)
+    if not created:
+        cache.invalidate_user(user.id)
+    return user, created
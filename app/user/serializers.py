@@ -1,19 +1,30 @@
 from rest_framework import serializers
 from rest_framework.serializers import ValidationError
+from rest_framework.exceptions import NotFound
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework import permissions, status
 from rest_framework.response import Response
+from django.conf import settings
+from django.db import transaction
+from django.db.models import ImageField
 from django.utils.translation import gettext_lazy as _
-from django.shortcuts import get_object_or_404
 from typing import Tuple, Optional
 from celery import current_app as celery_app
+from asgiref.sync import async_to_sync, sync_to_async
 # from twilio_sms.sms_client import SmsClient
 
-from core import response, exception
+from core import response
+from core.fields import StreamedImageField
+from core.uploads import StoredUploadedFile
+from core.dispatcher import dispatch_on_commit
 from user import models
 from user import utils
 from user import enums
+from user import last_login
+from user import avatars
+from user import provisioning
+from user.verification import code_store
 
 
 class EmailRegistration(serializers.ModelSerializer):
@@ -23,11 +34,6 @@ class EmailRegistration(serializers.ModelSerializer):
         read_only=True, default='success', required=False)
 
     def validate(self, attrs):
-        user = models.User.objects.filter(
-            email=attrs['email']
-        ).first()
-        if user:
-            raise ValidationError(_('User already registered'))
         password_candidate = attrs['password']
         utils.is_valid_password(password_candidate)
 
@@ -42,16 +48,18 @@ class EmailRegistration(serializers.ModelSerializer):
 
         return attrs
 
+    @transaction.atomic
     def create(self, validated_data: dict) -> models.User:
+        # Atomic: the verification email is dispatched only when the user is committed
         validated_data['email'] = validated_data['email'].lower()
-        password_candidate = validated_data['password']
+        password_candidate = validated_data.pop('password')
 
-        user = models.User(**validated_data)
-        user.set_password(password_candidate)
         try:
-            user.save()
+            user = provisioning.create_user(password_candidate, **validated_data)
         except Exception:
             raise ValidationError(_('Registration error'))
+        if user is None:
+            raise ValidationError(_('User already registered'))
 
         try:
             _send_verification_email(user_id=user.pk)
@@ -87,15 +95,10 @@ class PhoneRegistrationSerializer(serializers.ModelSerializer):
         return attrs
 
     def create(self, validated_data: dict) -> models.User:
-        phone = validated_data['phone']
-        if models.User.objects.filter(phone=phone).exists():
+        user = provisioning.create_user(
+            validated_data['password'], phone=validated_data['phone'])
+        if user is None:
             raise ValidationError(_('Already registered'))
-
-        user = models.User.objects.create(
-            phone=phone,
-        )
-        user.set_password(validated_data['password'])
-        user.save()
         # try:
         # client = SmsClient()
         # is_sent = client.send_sms_verification(user.phone)
@@ -111,24 +114,38 @@ class PhoneRegistrationSerializer(serializers.ModelSerializer):
         fields = ('phone', 'password', 'detail',)
 
 
-class LoginEmailSerializer(TokenObtainPairSerializer):
+class BufferedLastLoginMixin:
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        if settings.LAST_LOGIN_BUFFERED:
+            last_login.record(self.user.id)
+        return data
+
+
+class LoginEmailSerializer(BufferedLastLoginMixin, TokenObtainPairSerializer):
     def validate(self, attrs):
         attrs['email'] = attrs['email'].lower()
         return super().validate(attrs)
 
 
-class LoginPhoneSerializer(TokenObtainPairSerializer):
+class LoginPhoneSerializer(BufferedLastLoginMixin, TokenObtainPairSerializer):
     def validate(self, attrs):
         attrs['phone'] = attrs['phone']
         return super().validate(attrs)
 
 
 class UserDetailSerializer(serializers.ModelSerializer):
+    avatar_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = models.User
-        fields = ('name', 'surname', 'email', 'phone', 'avatar',
+        fields = ('name', 'surname', 'email', 'phone', 'avatar', 'avatar_variants',
                   'is_email_verified', 'is_phone_verified', 'is_superuser')
 
+    def get_avatar_variants(self, instance) -> dict:
+        """{variant: {format: url}}, empty until the avatar is processed"""
+        return avatars.variant_urls(instance.avatar_variants, self.context.get('request'))
+
 
 class UserUpdateSerializer(serializers.ModelSerializer):
     class Meta:
@@ -137,10 +154,32 @@ class UserUpdateSerializer(serializers.ModelSerializer):
 
 
 class AvatarSerializer(serializers.ModelSerializer):
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        ImageField: StreamedImageField,
+    }
+
     class Meta:
         model = models.User
         fields = ('avatar',)
 
+    def update(self, instance, validated_data):
+        avatar = validated_data.get('avatar')
+        if isinstance(avatar, StoredUploadedFile):
+            # Already in storage, the field only takes its name
+            validated_data['avatar'] = avatar.storage_name
+        # Previous variants are removed once the new ones are ready
+        stale = list(avatars.variant_names(instance.avatar_variants))
+        previous = instance.avatar.name if instance.avatar else None
+        instance.avatar_variants = {}
+        instance = super().update(instance, validated_data)
+        if instance.avatar:
+            dispatch_on_commit(
+                celery_app.send_task, 'process_avatar',
+                kwargs={'user_id': instance.id, 'name': instance.avatar.name,
+                        'stale': stale, 'previous': previous})
+        return instance
+
 
 # PASSWORD CHANGE SERIALIZERS
 class ChangePasswordSerializer(serializers.ModelSerializer):
@@ -184,17 +223,9 @@ class PasswordResetRequestSerializer(serializers.Serializer):
         if not user:
             raise ValidationError(_('User not found'))
 
-        code = utils.generate_verification_code()
-        print('code: ', code)
-        utils.set_verification_code(
-            code, enums.UserSecurityCode.RESET_PASSWORD, user.id)
-        celery_app.send_task(
-            'send_password_reset_request_email',
-            kwargs={
-                'user_id': user.id,
-                'code': code
-            }
-        )
+        dispatch_on_commit(
+            _dispatch_security_code, 'send_password_reset_request_email',
+            enums.UserSecurityCode.RESET_PASSWORD, user.id)
         return validated_data
 
 
@@ -218,14 +249,16 @@ class CheckPasswordResetCodeSerialiser(serializers.Serializer):
 
 
 class PasswordResetSubmitSerialiser(serializers.Serializer):
+    email = serializers.EmailField(write_only=True)
     code_candidate = serializers.CharField(write_only=True)
     password_candidate = serializers.CharField(write_only=True)
 
     def create(self, validated_data):
+        email_candidate = validated_data.get('email')
         code_candidate = validated_data.get('code_candidate')
         password_candidate = validated_data.get('password_candidate')
 
-        if not code_candidate or not password_candidate:
+        if not email_candidate or not code_candidate or not password_candidate:
             raise ValidationError(_('Not all fields are filled correctly'))
 
         is_valid = utils.is_valid_password(password_candidate)
@@ -234,31 +267,30 @@ class PasswordResetSubmitSerialiser(serializers.Serializer):
             raise ValidationError(
                 _('Password must contain at least 8 Characters: 1 lowercase or 1 uppercase, and 1 digit'))
 
-        user_id = utils.get_verification_code(
-            code_candidate, enums.UserSecurityCode.RESET_PASSWORD)
-        if not user_id:
+        user = models.User.objects.filter(email=email_candidate.lower()).first()
+        if not user:
             raise ValidationError(_('Code doest exist'))
 
-        user = models.User.objects.filter(id=user_id).first()
-        if not user:
-            raise exception.get(ValidationError, _('User does not exist'))
+        # Failed guesses count against the user's code, it locks after a few
+        if not code_store.check(
+                enums.UserSecurityCode.RESET_PASSWORD, user.id, code_candidate):
+            raise ValidationError(_('Code doest exist'))
 
         if user.check_password(password_candidate):
             raise ValidationError(
                 _('Old password cant be used as new password'))
 
-        updated = False
+        # Atomic consume: a code can reset the password only once
+        if not code_store.consume(
+                enums.UserSecurityCode.RESET_PASSWORD, user.id, code_candidate):
+            raise ValidationError(_('Code doest exist'))
+
         try:
             user.set_password(password_candidate)
             user.save()
-            updated = True
         except Exception as e:
             raise ValidationError(_('Update password error'))
 
-        if updated:
-            utils.delete_used_code(
-                code_candidate, enums.UserSecurityCode.RESET_PASSWORD)
-
         return Response({_('Password was successfully updated')}, status.HTTP_200_OK)
 
 
@@ -268,21 +300,20 @@ def check_password_reset_code_exist(user_email, code) -> Tuple[bool, Optional[st
     if not user:
         raise ValidationError(_('User does not exist'))
 
-    user_id_from_code = utils.get_verification_code(
-        code, enums.UserSecurityCode.RESET_PASSWORD)
-
-    if not (user_id_from_code) or (int(user_id_from_code) != user.id):
+    if not code_store.check(enums.UserSecurityCode.RESET_PASSWORD, user.id, code):
         return False, _('This code does not exist')
 
     return True, None
 
 
-def _send_verification_email(user_id):
-    code = utils.generate_verification_code()
-    utils.set_verification_code(
-        code, enums.UserSecurityCode.VERIFY_EMAIL, user_id)
+def _dispatch_security_code(task_name, code_type, user_id):
+    """Issue code and publish the email task, runs in the background dispatcher"""
+    code = code_store.issue(code_type, user_id)
+    if code is None:
+        # Resend cooldown, the previous code is still valid
+        return
     celery_app.send_task(
-        'send_verify_email',
+        task_name,
         kwargs={
             'user_id': user_id,
             'code': code
@@ -290,18 +321,29 @@ def _send_verification_email(user_id):
     )
 
 
+def _send_verification_email(user_id):
+    dispatch_on_commit(
+        _dispatch_security_code, 'send_verify_email',
+        enums.UserSecurityCode.VERIFY_EMAIL, user_id)
+
+
 class EmailVerifyRequestSerialiser(serializers.Serializer):
     email = serializers.EmailField()
 
     def create(self, validated_data):
+        return async_to_sync(self.acreate)(validated_data)
+
+    async def acreate(self, validated_data):
         email_candidate = validated_data.get('email')
-        user = get_object_or_404(models.User, email=email_candidate)
+        user = await models.User.objects.filter(email=email_candidate).afirst()
+        if user is None:
+            raise NotFound()
 
         if user.is_email_verified:
             raise ValidationError(_('Email already verified'))
         else:
             try:
-                _send_verification_email(user_id=user.id)
+                await sync_to_async(_send_verification_email)(user_id=user.id)
             except Exception as e:
                 print(f'\033[91m {str(e)} \033[0m')
 
@@ -313,27 +355,27 @@ class EmailVerifySubmitSerialiser(serializers.Serializer):
     code_candidate = serializers.CharField(write_only=True)
 
     def create(self, validated_data):
+        return async_to_sync(self.acreate)(validated_data)
+
+    async def acreate(self, validated_data):
         email_candidate = validated_data.get('email')
         code_candidate = validated_data.get('code_candidate')
 
         if not email_candidate or not code_candidate:
             raise ValidationError(_('Not all fields are filled correctly'))
 
-        is_valid_code = utils.compare_verification_code(
-            code_candidate, enums.UserSecurityCode.VERIFY_EMAIL)
-        if not is_valid_code:
-            raise ValidationError(_('Wrong code'))
-
-        user = models.User.objects.filter(email=email_candidate).first()
+        user = await models.User.objects.filter(email=email_candidate).afirst()
 
         if not user:
             raise ValidationError(_('User not found'))
 
-        user.is_email_verified = True
-        user.save()
+        is_valid_code = await code_store.aconsume(
+            enums.UserSecurityCode.VERIFY_EMAIL, user.id, code_candidate)
+        if not is_valid_code:
+            raise ValidationError(_('Wrong code'))
 
-        utils.delete_used_code(
-            code_candidate, enums.UserSecurityCode.VERIFY_EMAIL)
+        user.is_email_verified = True
+        await sync_to_async(user.save)()
 
         if user:
             return user
@@ -1,11 +1,81 @@
-import jwt
+"""
+Social sign-in. Signed ID tokens (OpenID Connect JWTs) are verified locally
+against the provider's cached JWKS, so most logins make no outbound calls.
+Opaque access tokens still go to the provider's userinfo API.
+The login views using these classes stay commented out in user/views.py and
+user/urls.py until the User model has the google_id/facebook_id/apple_id
+fields they link.
+"""
+from typing import Optional
 
+import jwt
 import requests
+from django.conf import settings
 
-import settings
+from core.http import http_session
+from core.jwks import JWKSCache, JWKSError
+from user import provisioning
+from user.google_oauth import TokenServiceUnavailable, google_token_client
 from user.models import User
 
 
+class InvalidIDToken(Exception):
+    pass
+
+
+class IDTokenVerifier:
+    ALGORITHMS = ('RS256', 'ES256')
+
+    def __init__(self, jwks_url: str, issuers, audiences, jwks: JWKSCache = None, leeway: int = None):
+        self.issuers = list(issuers)
+        self.audiences = list(audiences)
+        self.jwks = jwks or JWKSCache(jwks_url)
+        self.leeway = leeway if leeway is not None else settings.ID_TOKEN_LEEWAY
+
+    def verify(self, token: str) -> dict:
+        """Claims of a valid token, tokens for other audiences are rejected"""
+        try:
+            header = jwt.get_unverified_header(token)
+            if header.get('alg') not in self.ALGORITHMS:
+                raise InvalidIDToken(f"Algorithm {header.get('alg')} is not allowed")
+            key = self.jwks.get_key(header.get('kid'))
+            claims = jwt.decode(
+                token, key.key, algorithms=[header['alg']], audience=self.audiences,
+                leeway=self.leeway, options={'require': ['exp', 'iat', 'iss', 'sub', 'aud']})
+        except (jwt.PyJWTError, JWKSError) as e:
+            raise InvalidIDToken(str(e))
+        except requests.RequestException as e:
+            print('JWKS fetch error:', e)
+            raise TokenServiceUnavailable()
+
+        if claims['iss'] not in self.issuers:
+            raise InvalidIDToken(f"Issuer {claims['iss']} is not allowed")
+        return claims
+
+
+_verifiers = {}
+
+
+def get_verifier(provider: str) -> IDTokenVerifier:
+    verifier = _verifiers.get(provider)
+    if verifier is None:
+        config = settings.SOCIAL_ID_TOKEN_PROVIDERS[provider]
+        verifier = _verifiers[provider] = IDTokenVerifier(
+            config['jwks_url'], config['issuers'], config['audiences'])
+    return verifier
+
+
+def is_jwt(token: str) -> bool:
+    return token.count('.') == 2
+
+
+def verified_email(claims: dict) -> Optional[str]:
+    # Apple sends the flag as a string
+    if str(claims.get('email_verified', 'true')).lower() != 'true':
+        return None
+    return claims.get('email')
+
+
 class SocialUserMixin:
     USER_FIELD_NAME = None
 
@@ -13,10 +83,8 @@ class SocialUserMixin:
         if not self.email or not self.social_id:
             return None
 
-        user, is_created = User.objects.get_or_create(email=self.email)
-        setattr(user, self.USER_FIELD_NAME, self.social_id)
-        user.is_email_verified = True
-        user.save()
+        user, is_created = provisioning.get_or_create_social_user(
+            self.email, self.USER_FIELD_NAME, self.social_id)
         return user
 
 
@@ -24,24 +92,36 @@ class GoogleUser(SocialUserMixin):
     USER_FIELD_NAME = 'google_id'
 
     def __init__(self, social_token):
-        url = f'{settings.GOOGLE_AUTH_BASE_URL}&access_token={social_token}'
-        response = requests.get(url)
-
-        if response.status_code >= 400:
-            print("Google auth error:", response.content)
-
-        google_data = response.json()
+        if is_jwt(social_token):
+            try:
+                google_data = get_verifier('google').verify(social_token)
+            except InvalidIDToken as e:
+                print("Google auth error:", e)
+                google_data = {}
+        else:
+            google_data = google_token_client.userinfo(social_token) or {}
 
-        self.social_id = google_data.get('id')
-        self.email = google_data.get('email')
+        self.social_id = google_data.get('sub')
+        self.email = verified_email(google_data)
 
 
 class FacebookUser(SocialUserMixin):
     USER_FIELD_NAME = "facebook_id"
 
     def __init__(self, social_token):
-        url = f"{settings.FACEBOOK_AUTH_BASE_URL}&access_token={social_token}"
-        response = requests.get(url)
+        if is_jwt(social_token):
+            # Limited Login token, verified without calling the Graph API
+            try:
+                claims = get_verifier('facebook').verify(social_token)
+            except InvalidIDToken as e:
+                print("Facebook auth error:", e)
+                claims = {}
+            self.social_id = claims.get("sub")
+            self.email = verified_email(claims)
+            return
+
+        response = http_session().get(
+            settings.FACEBOOK_AUTH_BASE_URL, params={'access_token': social_token})
 
         if response.status_code >= 400:
             print("Facebook auth error:", response.content)
@@ -57,13 +137,13 @@ class AppleUser(SocialUserMixin):
 
     def __init__(self, social_token):
         try:
-            apple_data = jwt.decode(social_token, "", options={"verify_signature": False})
-        except Exception:
-            print("Apple auth error.")
+            apple_data = get_verifier('apple').verify(social_token)
+        except InvalidIDToken as e:
+            print("Apple auth error:", e)
             apple_data = {}
 
         self.social_id = apple_data.get("sub")
-        self.email = apple_data.get("email")
+        self.email = verified_email(apple_data)
 
     def get_user(self):
         if self.email:
@@ -0,0 +1,14 @@
+from celery import shared_task
+
+from user import avatars
+from user import last_login
+
+
+@shared_task(name="flush_last_login")
+def flush_last_login_task():
+    last_login.flush()
+
+
+@shared_task(name="process_avatar")
+def process_avatar_task(user_id, name, stale=(), previous=None):
+    avatars.process_avatar(user_id, name, stale, previous)
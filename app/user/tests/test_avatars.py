@@ -0,0 +1,88 @@
+import hashlib
+from io import BytesIO
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from user import avatars
+
+
+def jpeg(exif: bool) -> bytes:
+    image = Image.new('RGB', (64, 48), 'red')
+    buffer = BytesIO()
+    if exif:
+        metadata = Image.Exif()
+        metadata[0x010f] = 'Camera'
+        image.save(buffer, format='JPEG', exif=metadata.tobytes())
+    else:
+        image.save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+class ProcessAvatarTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='user@example.com', password='password')
+
+    def upload(self, content: bytes) -> str:
+        name = default_storage.save('user/avatar.jpg', ContentFile(content))
+        self.addCleanup(default_storage.delete, name)
+        get_user_model().objects.filter(id=self.user.id).update(avatar=name, avatar_variants={})
+        return name
+
+    def test_metadata_is_stripped_into_a_copy(self):
+        name = self.upload(jpeg(exif=True))
+        avatars.process_avatar(self.user.id, name)
+
+        self.user.refresh_from_db()
+        self.assertNotEqual(self.user.avatar.name, name)
+        self.assertFalse(default_storage.exists(name))
+        with default_storage.open(self.user.avatar.name) as f:
+            self.assertFalse(Image.open(f).getexif())
+        for variant in avatars.variant_names(self.user.avatar_variants):
+            self.assertTrue(default_storage.exists(variant))
+
+    @override_settings(MEDIA_CONTENT_HASH_PATHS=True)
+    def test_stripped_copy_is_named_by_its_content(self):
+        name = self.upload(jpeg(exif=True))
+        avatars.process_avatar(self.user.id, name)
+
+        self.user.refresh_from_db()
+        self.addCleanup(default_storage.delete, self.user.avatar.name)
+        with default_storage.open(self.user.avatar.name) as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        self.assertEqual(self.user.avatar.name, f'user/{digest[:2]}/{digest[2:4]}/{digest}.jpg')
+        self.assertFalse(default_storage.exists(name))
+
+    def test_rebuild_keeps_the_original(self):
+        name = self.upload(jpeg(exif=False))
+        with default_storage.open(name) as f:
+            content = f.read()
+
+        avatars.process_avatar(self.user.id, name)
+        avatars.process_avatar(self.user.id, name)
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.avatar.name, name)
+        with default_storage.open(name) as f:
+            self.assertEqual(f.read(), content)
+
+    def test_superseded_task_still_removes_the_previous_avatar(self):
+        first = self.upload(jpeg(exif=False))
+        avatars.process_avatar(self.user.id, first)
+        self.user.refresh_from_db()
+        stale = list(avatars.variant_names(self.user.avatar_variants))
+
+        second = self.upload(jpeg(exif=False))
+        third = self.upload(jpeg(exif=False))
+        # The task for the second upload runs after the third upload
+        avatars.process_avatar(self.user.id, second, stale, first)
+        avatars.process_avatar(self.user.id, third, (), second)
+
+        for name in [first, second, *stale]:
+            self.assertFalse(default_storage.exists(name))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.avatar.name, third)
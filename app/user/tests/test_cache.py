@@ -0,0 +1,37 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache as shared_cache
+from django.db import transaction
+from django.test import TestCase
+
+from user import cache
+
+
+class UserCacheTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='user@example.com', password='password')
+        cache.invalidate_user(self.user.id)
+
+    def test_password_hash_is_not_cached(self):
+        cache.get_user(self.user.id)
+        cached = shared_cache.get(f'user:auth:{self.user.id}')
+        self.assertNotIn('password', cached.__dict__)
+
+        # Loaded from the database when needed
+        self.assertTrue(cache.get_user(self.user.id).check_password('password'))
+
+    def test_bulk_invalidation(self):
+        cache.get_user(self.user.id)
+        cache.invalidate_users([self.user.id])
+        self.assertIsNone(shared_cache.get(f'user:auth:{self.user.id}'))
+        self.assertIsNone(cache.local_users.get(f'user:auth:{self.user.id}'))
+
+    def test_invalidated_again_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                cache.invalidate_user(self.user.id)
+                # A concurrent request caches the row before the commit
+                cache.get_user(self.user.id)
+                self.assertIsNotNone(shared_cache.get(f'user:auth:{self.user.id}'))
+        self.assertIsNone(shared_cache.get(f'user:auth:{self.user.id}'))
+        self.assertIsNone(cache.local_users.get(f'user:auth:{self.user.id}'))
@@ -0,0 +1,34 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache as shared_cache
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from user import cache
+
+
+class DetailETagTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email='user@example.com', password='password')
+        token = RefreshToken.for_user(self.user).access_token
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    def test_not_modified_varies_on_authorization(self):
+        response = self.client.get(reverse('user:detail'), **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Authorization', response['Vary'])
+
+        response = self.client.get(reverse('user:detail'), HTTP_IF_NONE_MATCH=response['ETag'], **self.auth)
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('Authorization', response['Vary'])
+
+    def test_inactive_user_gets_no_304(self):
+        etag = self.client.get(reverse('user:detail'), **self.auth)['ETag']
+        # The version survives, only the cached user is reloaded
+        get_user_model().objects.filter(id=self.user.id).update(is_active=False)
+        shared_cache.delete(f'user:auth:{self.user.id}')
+        cache.local_users.delete(f'user:auth:{self.user.id}')
+
+        response = self.client.get(reverse('user:detail'), HTTP_IF_NONE_MATCH=etag, **self.auth)
+        self.assertEqual(response.status_code, 401)
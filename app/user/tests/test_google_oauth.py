@@ -0,0 +1,34 @@
+import requests
+from django.test import SimpleTestCase
+
+from user.google_oauth import GoogleTokenClient, TokenServiceUnavailable
+
+
+def response(status_code: int, content: bytes) -> requests.Response:
+    result = requests.Response()
+    result.status_code = status_code
+    result._content = content
+    return result
+
+
+class GoogleTokenParseTests(SimpleTestCase):
+
+    def setUp(self):
+        self.client = GoogleTokenClient()
+
+    def test_userinfo(self):
+        data = self.client._parse(response(200, b'{"sub": "1", "email": "user@example.com"}'))
+        self.assertEqual(data['sub'], '1')
+
+    def test_rejected_token_is_invalid(self):
+        for status_code in (400, 401):
+            self.assertIs(self.client._parse(response(status_code, b'{}')), GoogleTokenClient.INVALID)
+
+    def test_other_errors_are_not_cached_as_invalid(self):
+        for status_code in (403, 429, 500):
+            with self.assertRaises(TokenServiceUnavailable):
+                self.client._parse(response(status_code, b'{}'))
+
+    def test_non_json_body(self):
+        with self.assertRaises(TokenServiceUnavailable):
+            self.client._parse(response(200, b'<html>Service unavailable</html>'))
@@ -0,0 +1,39 @@
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, get_hasher
+from django.test import TestCase
+
+from user.hashers import TunedArgon2PasswordHasher
+from user.models import User
+
+
+class CheapArgon2PasswordHasher(TunedArgon2PasswordHasher):
+    time_cost = 1
+    memory_cost = 1024
+
+
+class PasswordHasherTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='user@example.com', password='password')
+
+    def test_profile_hasher_is_default(self):
+        self.assertEqual(get_hasher().algorithm, 'argon2')
+        self.assertTrue(self.user.password.startswith('argon2$'))
+        self.assertTrue(self.user.check_password('password'))
+        self.assertFalse(self.user.check_password('wrong'))
+
+    def _stored(self, hasher):
+        User.objects.filter(pk=self.user.pk).update(password=hasher.encode('password', hasher.salt()))
+        return User.objects.get(pk=self.user.pk)
+
+    def test_outdated_parameters_are_rehashed_on_login(self):
+        user = self._stored(CheapArgon2PasswordHasher())
+        self.assertTrue(user.check_password('password'))
+
+        stored = User.objects.get(pk=user.pk).password
+        self.assertFalse(get_hasher().must_update(stored))
+        self.assertTrue(User.objects.get(pk=user.pk).check_password('password'))
+
+    def test_other_profile_hash_is_upgraded(self):
+        user = self._stored(PBKDF2PasswordHasher())
+        self.assertTrue(user.check_password('password'))
+        self.assertTrue(User.objects.get(pk=user.pk).password.startswith('argon2$'))
@@ -0,0 +1,58 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TransactionTestCase
+
+from user import provisioning
+from user.models import User
+
+PARALLEL_SIGNUPS = 8
+
+
+@skipUnless(connection.vendor == 'postgresql', 'INSERT ... RETURNING xmax is PostgreSQL only')
+class ProvisioningConcurrencyTests(TransactionTestCase):
+    """Parallel duplicate signups must create exactly one user"""
+
+    def _run_parallel(self, func):
+        barrier = Barrier(PARALLEL_SIGNUPS)
+
+        def worker(_):
+            barrier.wait()
+            try:
+                return func()
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(PARALLEL_SIGNUPS) as executor:
+            return list(executor.map(worker, range(PARALLEL_SIGNUPS)))
+
+    def test_duplicate_email_signups(self):
+        results = self._run_parallel(
+            lambda: provisioning.create_user('Password1', email='race@example.com'))
+
+        created = [user for user in results if user is not None]
+        self.assertEqual(len(created), 1)
+        self.assertEqual(User.objects.filter(email='race@example.com').count(), 1)
+        self.assertTrue(created[0].check_password('Password1'))
+
+    def test_duplicate_social_logins(self):
+        results = self._run_parallel(
+            lambda: provisioning.get_or_create_social_user(
+                'social@example.com', defaults={'name': 'Jane'}))
+
+        self.assertEqual(sum(1 for _, created in results if created), 1)
+        self.assertEqual(len({user.id for user, _ in results}), 1)
+        user = User.objects.get(email='social@example.com')
+        self.assertTrue(user.is_email_verified)
+        self.assertEqual(user.name, 'Jane')
+
+    def test_phone_signups_without_email(self):
+        first = provisioning.create_user('Password1', phone='+15550000001')
+        second = provisioning.create_user('Password1', phone='+15550000002')
+
+        self.assertIsNotNone(first)
+        self.assertIsNotNone(second)
+        self.assertIsNone(second.email)
+        self.assertIsNone(provisioning.create_user('Password1', phone='+15550000001'))
@@ -0,0 +1,82 @@
+import json
+import time
+from unittest import mock
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.test import SimpleTestCase, override_settings
+
+from core.jwks import JWKSCache
+from user.social_oauth import IDTokenVerifier, InvalidIDToken
+
+ISSUER = 'https://accounts.google.com'
+AUDIENCE = 'client-id.apps.googleusercontent.com'
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def _key_pair(kid):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk.update(kid=kid, alg='RS256', use='sig')
+    return private_key, jwk
+
+
+@override_settings(CACHES=LOCMEM)
+class IDTokenVerifierTests(SimpleTestCase):
+
+    def setUp(self):
+        self.key, self.jwk = _key_pair('key-1')
+        self.jwks = {'keys': [self.jwk]}
+        self.fetch = mock.Mock(side_effect=lambda url: self.jwks)
+        self.cache = JWKSCache('https://example.com/certs', fetch=self.fetch, ttl=3600,
+                               refresh_after=1800, miss_interval=0)
+        self.verifier = IDTokenVerifier(None, [ISSUER], [AUDIENCE], jwks=self.cache, leeway=0)
+
+    def tearDown(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def _token(self, key=None, kid='key-1', **claims):
+        now = int(time.time())
+        payload = {'iss': ISSUER, 'aud': AUDIENCE, 'sub': '42', 'iat': now, 'exp': now + 600,
+                   'email': 'user@example.com', 'email_verified': True}
+        payload.update(claims)
+        return jwt.encode(payload, key or self.key, algorithm='RS256', headers={'kid': kid})
+
+    def test_valid_token_needs_one_fetch(self):
+        self.assertEqual(self.verifier.verify(self._token())['sub'], '42')
+        self.assertEqual(self.verifier.verify(self._token())['sub'], '42')
+        self.assertEqual(self.fetch.call_count, 1)
+
+    def test_key_set_is_shared_through_cache(self):
+        self.verifier.verify(self._token())
+        other = JWKSCache('https://example.com/certs', fetch=self.fetch)
+        IDTokenVerifier(None, [ISSUER], [AUDIENCE], jwks=other).verify(self._token())
+        self.assertEqual(self.fetch.call_count, 1)
+
+    def test_unknown_kid_refetches_rotated_keys(self):
+        self.verifier.verify(self._token())
+        new_key, new_jwk = _key_pair('key-2')
+        self.jwks = {'keys': [self.jwk, new_jwk]}
+
+        claims = self.verifier.verify(self._token(key=new_key, kid='key-2'))
+        self.assertEqual(claims['sub'], '42')
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_rejects_foreign_signature(self):
+        foreign_key, _ = _key_pair('key-1')
+        with self.assertRaises(InvalidIDToken):
+            self.verifier.verify(self._token(key=foreign_key))
+
+    def test_rejects_other_audience_and_issuer(self):
+        with self.assertRaises(InvalidIDToken):
+            self.verifier.verify(self._token(aud='another-app'))
+        with self.assertRaises(InvalidIDToken):
+            self.verifier.verify(self._token(iss='https://evil.example.com'))
+
+    def test_rejects_expired_and_unsigned_tokens(self):
+        with self.assertRaises(InvalidIDToken):
+            self.verifier.verify(self._token(exp=int(time.time()) - 10))
+        unsigned = jwt.encode({'sub': '42'}, None, algorithm='none')
+        with self.assertRaises(InvalidIDToken):
+            self.verifier.verify(unsigned)
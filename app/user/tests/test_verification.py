@@ -0,0 +1,53 @@
+from django.test import SimpleTestCase
+
+from user.enums import UserSecurityCode
+from user.verification import InMemoryCodeBackend, VerificationCodeStore
+
+PURPOSE = UserSecurityCode.VERIFY_EMAIL
+
+
+class VerificationCodeStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        self.store = VerificationCodeStore(
+            backend=InMemoryCodeBackend(), ttl=60, cooldown=0, max_attempts=3)
+
+    def test_code_is_consumed_once(self):
+        code = self.store.issue(PURPOSE, 1)
+
+        self.assertTrue(self.store.check(PURPOSE, 1, code))
+        self.assertTrue(self.store.consume(PURPOSE, 1, code))
+        self.assertFalse(self.store.consume(PURPOSE, 1, code))
+
+    def test_code_is_bound_to_user(self):
+        code = self.store.issue(PURPOSE, 1)
+
+        self.assertFalse(self.store.consume(PURPOSE, 2, code))
+        self.assertTrue(self.store.consume(PURPOSE, 1, code))
+
+    def test_locked_after_max_attempts(self):
+        code = self.store.issue(PURPOSE, 1)
+        for _ in range(3):
+            self.assertFalse(self.store.check(PURPOSE, 1, 'WRONG1'))
+
+        self.assertFalse(self.store.consume(PURPOSE, 1, code))
+
+    def test_resend_cooldown(self):
+        store = VerificationCodeStore(
+            backend=InMemoryCodeBackend(), ttl=60, cooldown=30, max_attempts=3)
+        code = store.issue(PURPOSE, 1)
+
+        self.assertIsNone(store.issue(PURPOSE, 1))
+        self.assertTrue(store.check(PURPOSE, 1, code))
+
+    def test_new_code_replaces_previous(self):
+        first = self.store.issue(PURPOSE, 1)
+        second = self.store.issue(PURPOSE, 1)
+
+        self.assertFalse(self.store.check(PURPOSE, 1, first))
+        self.assertTrue(self.store.consume(PURPOSE, 1, second))
+
+    def test_keys_of_a_user_share_a_slot(self):
+        # {...} hash tag, scripts touching both keys work on Redis Cluster
+        self.assertIn('{VERIFY_EMAIL:1}', self.store._key(PURPOSE, 1))
+        self.assertIn('{VERIFY_EMAIL:1}', self.store._cooldown_key(PURPOSE, 1))
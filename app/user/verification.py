@@ -0,0 +1,182 @@
+"""
+Verification codes stored per user and purpose. Every operation is a single
+atomic round trip: issuing checks the resend cooldown, checking counts failed
+attempts, and consuming deletes the code in the same step as the comparison.
+Codes are only looked up by user, so guesses always count against a code's
+attempts. Keys of one user share a hash tag, the scripts work on Redis Cluster.
+"""
+import secrets
+import string
+import threading
+import time
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from core import aio
+from core.redis import redis_pools
+
+CODE_CHARS = string.ascii_uppercase + string.digits
+
+# Return values of backend check()
+VALID, INVALID, LOCKED = 1, 0, -1
+
+ISSUE_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 1 then return 0 end
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], 'code', ARGV[1], 'attempts', 0)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+if tonumber(ARGV[3]) > 0 then redis.call('SET', KEYS[2], 1, 'EX', ARGV[3]) end
+return 1
+"""
+
+CHECK_SCRIPT = """
+local stored = redis.call('HMGET', KEYS[1], 'code', 'attempts')
+if not stored[1] then return 0 end
+if tonumber(stored[2]) >= tonumber(ARGV[2]) then return -1 end
+if stored[1] ~= ARGV[1] then
+    redis.call('HINCRBY', KEYS[1], 'attempts', 1)
+    return 0
+end
+if ARGV[3] == '1' then redis.call('DEL', KEYS[1]) end
+return 1
+"""
+
+
+def _purpose(purpose) -> str:
+    # UserSecurityCode members format differently across Python versions
+    return getattr(purpose, 'value', purpose)
+
+
+class RedisCodeBackend:
+    def __init__(self, pool_name: str = 'default'):
+        self.pool_name = pool_name
+        self._scripts = {}
+        self._async_scripts = {}
+
+    def _script(self, source):
+        client = redis_pools.client(self.pool_name)
+        # Script object caches the sha and falls back to EVAL on NOSCRIPT
+        if source not in self._scripts:
+            self._scripts[source] = client.register_script(source)
+        return self._scripts[source], client
+
+    def issue(self, key, cooldown_key, code, ttl, cooldown) -> int:
+        script, client = self._script(ISSUE_SCRIPT)
+        return script(keys=[key, cooldown_key], args=[code, ttl, cooldown], client=client)
+
+    def check(self, key, code, max_attempts, consume) -> int:
+        script, client = self._script(CHECK_SCRIPT)
+        return script(keys=[key], args=[code, max_attempts, int(consume)], client=client)
+
+    async def acheck(self, key, code, max_attempts, consume) -> int:
+        if not aio.loop_clients_enabled():
+            return await sync_to_async(self.check)(key, code, max_attempts, consume)
+        client = redis_pools.async_client(self.pool_name)
+        if CHECK_SCRIPT not in self._async_scripts:
+            self._async_scripts[CHECK_SCRIPT] = client.register_script(CHECK_SCRIPT)
+        return await self._async_scripts[CHECK_SCRIPT](
+            keys=[key], args=[code, max_attempts, int(consume)], client=client)
+
+
+class InMemoryCodeBackend:
+    """Process-local backend with the same semantics, for tests and local runs"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def _set(self, key, value, ttl):
+        self._data[key] = (value, time.monotonic() + int(ttl))
+
+    def issue(self, key, cooldown_key, code, ttl, cooldown) -> int:
+        with self._lock:
+            if self._get(cooldown_key) is not None:
+                return 0
+            self._set(key, {'code': code, 'attempts': 0}, ttl)
+            if int(cooldown) > 0:
+                self._set(cooldown_key, 1, cooldown)
+            return 1
+
+    def check(self, key, code, max_attempts, consume) -> int:
+        with self._lock:
+            stored = self._get(key)
+            if stored is None:
+                return INVALID
+            if stored['attempts'] >= max_attempts:
+                return LOCKED
+            if stored['code'] != code:
+                stored['attempts'] += 1
+                return INVALID
+            if consume:
+                self._data.pop(key, None)
+            return VALID
+
+    async def acheck(self, key, code, max_attempts, consume) -> int:
+        return self.check(key, code, max_attempts, consume)
+
+
+class VerificationCodeStore:
+    def __init__(self, backend=None, ttl: int = None, cooldown: int = None,
+                 max_attempts: int = None, size: int = 6):
+        self.backend = backend or RedisCodeBackend()
+        self.ttl = ttl if ttl is not None else settings.RESET_CODE_EXPIRE
+        self.cooldown = cooldown if cooldown is not None else settings.VERIFICATION_CODE_RESEND_COOLDOWN
+        self.max_attempts = max_attempts or settings.VERIFICATION_CODE_MAX_ATTEMPTS
+        self.size = size
+
+    @staticmethod
+    def _key(purpose, user_id) -> str:
+        return f'verification:{{{_purpose(purpose)}:{user_id}}}:code'
+
+    @staticmethod
+    def _cooldown_key(purpose, user_id) -> str:
+        return f'verification:{{{_purpose(purpose)}:{user_id}}}:cooldown'
+
+    def generate_code(self) -> str:
+        return ''.join(secrets.choice(CODE_CHARS) for _ in range(self.size))
+
+    def issue(self, purpose, user_id) -> Optional[str]:
+        """
+        New code for user replacing the previous one, None during resend cooldown
+        """
+        code = self.generate_code()
+        result = self.backend.issue(
+            self._key(purpose, user_id), self._cooldown_key(purpose, user_id),
+            code, self.ttl, self.cooldown)
+        return code if result == 1 else None
+
+    def check(self, purpose, user_id, code) -> bool:
+        """Compare code without using it up, failed attempts are counted"""
+        return self.backend.check(
+            self._key(purpose, user_id), code, self.max_attempts, False) == VALID
+
+    def consume(self, purpose, user_id, code) -> bool:
+        """Compare and delete the code in one step, it can be used only once"""
+        return self.backend.check(
+            self._key(purpose, user_id), code, self.max_attempts, True) == VALID
+
+    async def aconsume(self, purpose, user_id, code) -> bool:
+        """consume() for async views"""
+        return await self.backend.acheck(
+            self._key(purpose, user_id), code, self.max_attempts, True) == VALID
+
+
+def _default_backend():
+    if settings.VERIFICATION_CODE_BACKEND == 'memory':
+        return InMemoryCodeBackend()
+    return RedisCodeBackend()
+
+
+code_store = VerificationCodeStore(backend=_default_backend())
@@ -1,4 +1,8 @@
+from asgiref.sync import sync_to_async
+from django.utils.decorators import method_decorator
 from django.utils.translation import gettext_lazy as _
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_headers
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.parsers import FileUploadParser
@@ -6,13 +10,14 @@ from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import generics
 from rest_framework.response import Response
-from rest_framework.views import APIView
 from rest_framework_simplejwt.views import TokenObtainPairView
 
-import requests
-
-from settings import GOOGLE_AUTH_BASE_URL
-from user.google_oauth import GoogleUser
+from core.async_views import AsyncAPIView, AsyncCreateAPIView
+from core.models import content_hash_path
+from core.uploads import StoredUploadedFile, StreamingUploadMixin
+from user.authentication import get_token_user_id
+from user.google_oauth import GoogleUser, google_token_client
+from user import cache
 from user import serializers
 from user import models
 
@@ -34,6 +39,24 @@ class LoginPhoneView(TokenObtainPairView):
     serializer_class = serializers.LoginPhoneSerializer
 
 
+def user_detail_etag(request, *args, **kwargs):
+    """
+    Strong ETag from the per-user version. Checked before DRF authentication,
+    so a matching If-None-Match gets 304 without serializing the user. The
+    ETag depends on the token, views using it vary on Authorization
+    """
+    user_id = get_token_user_id(request)
+    if user_id is None:
+        return None
+    user = cache.get_user(user_id)
+    if user is None or not user.is_active:
+        # No 304, authentication rejects the request
+        return None
+    return f'"{user_id}-{cache.get_user_version(user_id)}"'
+
+
+@method_decorator(vary_on_headers('Authorization'), name='dispatch')
+@method_decorator(condition(etag_func=user_detail_etag), name='dispatch')
 class DetailView(generics.RetrieveAPIView):
     serializer_class = serializers.UserDetailSerializer
     permission_classes = [IsAuthenticated]
@@ -42,7 +65,7 @@ class DetailView(generics.RetrieveAPIView):
         return self.request.user
 
 
-class AvatarView(generics.UpdateAPIView):
+class AvatarView(StreamingUploadMixin, generics.UpdateAPIView):
     serializer_class = serializers.AvatarSerializer
     permission_classes = [IsAuthenticated]
     parser_classes = [MultiPartParser, FileUploadParser]
@@ -51,23 +74,42 @@ class AvatarView(generics.UpdateAPIView):
     def get_object(self):
         return self.request.user
 
-
-class GoogleAuth(APIView):
+    def get_upload_path(self, file_name, digest=None):
+        if digest:
+            return content_hash_path(file_name, digest, prefix='user')
+        return models.User._meta.get_field('avatar').generate_filename(models.User(), file_name)
+
+    def update(self, request, *args, **kwargs):
+        try:
+            return super().update(request, *args, **kwargs)
+        except Exception:
+            # Streamed files are stored before validation, drop rejected ones
+            # unless another user's avatar is the same content addressed file
+            for upload in request.FILES.values():
+                if isinstance(upload, StoredUploadedFile):
+                    upload.delete(models.User.objects.filter(avatar=upload.storage_name).exists)
+            raise
+        finally:
+            for upload in request.FILES.values():
+                if isinstance(upload, StoredUploadedFile):
+                    upload.release()
+
+
+class GoogleAuth(AsyncAPIView):
     serializer_class = serializers.UserDetailSerializer
 
-    def post(self, request):
-        base_url = GOOGLE_AUTH_BASE_URL
+    async def post(self, request):
         token = request.data.get('token', '')
-        url = f'{base_url}&access_token={token}'
-        res = requests.get(url)
-        data = res.json()
-        if not 'sub' in data:
+        data = await google_token_client.auserinfo(token)
+        if data is None:
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
-        user = GoogleUser(data).get_user()
+        user = await sync_to_async(GoogleUser(data).get_user)()
         serialized = serializers.UserDetailSerializer(user, context={'request': request})
         return Response(serialized.data, status=status.HTTP_201_CREATED)
 
+    @method_decorator(vary_on_headers('Authorization'))
+    @method_decorator(condition(etag_func=user_detail_etag))
     def get(self, request):
         user = self.request.user
         serialized = serializers.UserDetailSerializer(instance=user)
@@ -91,10 +133,10 @@ class CheckPasswordResetCodeView(generics.CreateAPIView):
     serializer_class = serializers.CheckPasswordResetCodeSerialiser
 
 # EMAIL VERIFICATION VIEWS
-class EmailVerifyRequestView(generics.CreateAPIView):
+class EmailVerifyRequestView(AsyncCreateAPIView):
     serializer_class = serializers.EmailVerifyRequestSerialiser
 
-class EmailVerifySubmitView(generics.CreateAPIView):
+class EmailVerifySubmitView(AsyncCreateAPIView):
     serializer_class = serializers.EmailVerifySubmitSerialiser
 
 
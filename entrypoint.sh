@@ -18,6 +18,7 @@ then
 else
     python /app/manage.py migrate
     python /app/manage.py createsuperuser --noinput
-    gunicorn --bind 0.0.0.0:80 --workers 1 --threads 8 --timeout 0 wsgi:application
+    # Workers, threads and worker class (SERVER_MODE) are set in gunicorn.conf.py
+    gunicorn -c /app/gunicorn.conf.py
 fi
 exec "$@"